@@ -1,5 +1,21 @@
-from .sigil import Sigil
-from .context import Context
+import importlib
 
+# Exports are imported on first access, so that the command line client can
+# start without loading the engine and its tools.
+_exports = {
+    'Sigil': '.sigil',
+    'Context': '.context',
+    'SigilSet': '.bundle',
+    'MISSING': '.sigil',
+}
 
-__all__ = ['Sigil', 'Context']
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ['Sigil', 'Context', 'SigilSet', 'MISSING']
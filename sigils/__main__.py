@@ -1,22 +1,33 @@
 import sys
-import random
 import argparse
 import os
 import json
-import tomllib as toml  
-from sigils import Sigil
 
+# Heavier modules (including the sigils engine itself) are imported where they
+# are used, so that forwarding a call to a running daemon stays cheap.
 
-def load_context(context_file):
+
+def load_context(context_file, lazy=None):
+    """Load a JSON or TOML context file.
+
+    Big JSON files (or any, with lazy=True) are memory-mapped and decoded only
+    where a template reads them; see sigils.lazyjson.
+    """
     if not context_file:
         return {}
-    
+
+    if context_file.endswith('.json') and lazy is not False:
+        if lazy or os.path.getsize(context_file) >= LARGE_FILE_SIZE:
+            from .lazyjson import load
+            return load(context_file)
+
     with open(context_file, 'r') as f:
         if context_file.endswith('.json'):
             return json.load(f)
         elif context_file.endswith('.toml'):
             try:
-                return toml.load(f)
+                import tomllib
+                return tomllib.loads(f.read())
             except ImportError:
                 import toml  # Fallback for older Python versions
                 return toml.load(f)
@@ -25,34 +36,317 @@ def load_context(context_file):
             sys.exit(1)
 
 
-def process_file(input_path, output_path, context, debug):
+# Files at least this big are streamed in chunks instead of being read whole
+LARGE_FILE_SIZE = 64 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+# A left bracket still open this many characters later is plain text, even on a long line
+MAX_SIGIL_SIZE = 64 * 1024
+
+
+def _chunk_cut(buffer, line, brackets):
+    """Return (cut, held): where buffer can be split without cutting a sigil started
+    after line, and whether the text from cut on is a sigil left open."""
+    from .parser import scan, ESCAPE
+    left = brackets[0]
+    unfinished = scan(buffer[line:], brackets)[2]
+    if unfinished is not None:
+        cut = line + unfinished
+    else:
+        cut = len(buffer)
+        # The buffer may end with the first characters of a left bracket
+        for size in range(len(left) - 1, 0, -1):
+            if buffer.endswith(left[:size]):
+                cut -= size
+                break
+    # Keep an escape together with the bracket that may follow it
+    if cut > line and buffer[cut - 1] == ESCAPE:
+        cut -= 1
+    return cut, unfinished is not None
+
+
+def iter_template_chunks(file, chunk_size=CHUNK_SIZE, brackets=("%[", "]"),
+                         max_sigil=MAX_SIGIL_SIZE):
+    """Read a template in chunks, never splitting a sigil across two chunks.
+
+    Any trailing text that might be the start of an unfinished sigil (nested
+    ones included) is held back and prepended to the next chunk. A sigil
+    cannot span lines, and a left bracket not closed within max_sigil
+    characters is plain text, so the carried text stays bounded and each
+    character is scanned a bounded number of times.
+    """
+    left, right = brackets
+    tail = ''
+    held = False
+    while True:
+        data = file.read(chunk_size)
+        if not data:
+            if tail:
+                yield tail
+            return
+        buffer = tail + data
+        if held and '\n' not in data and right not in buffer[max(0, len(tail) - len(right) + 1):]:
+            # Nothing read can close the sigil the tail starts with, so skip scanning it again
+            cut = 0
+        else:
+            cut, held = _chunk_cut(buffer, buffer.rfind('\n') + 1, brackets)
+        while held and len(buffer) - cut > max_sigil:
+            # Give up on the bracket as if its line had ended there, and scan what follows it
+            cut += len(left)
+            yield buffer[:cut]
+            buffer = buffer[cut:]
+            cut, held = _chunk_cut(buffer, 0, brackets)
+        tail = buffer[cut:]
+        if cut:
+            yield buffer[:cut]
+
+
+def write_atomic(output_path, chunks):
+    """Write chunks to a temp file next to output_path, then rename it into place."""
+    import shutil
+    directory = os.path.dirname(os.path.abspath(output_path))
+    while True:
+        temp_path = os.path.join(directory, f'.sigils-{os.urandom(6).hex()}.tmp')
+        try:
+            # Unlike mkstemp (0o600), this lets the process umask set the mode of new files
+            fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, 'w') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        if os.path.exists(output_path):
+            shutil.copymode(output_path, temp_path)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def stream_file(input_path, context, chunk_size=CHUNK_SIZE):
+    """Yield the solved output of a template file chunk by chunk."""
+    from .sigil import Sigil
+    with open(input_path, 'r') as file:
+        for piece in iter_template_chunks(file, chunk_size):
+            yield from Sigil(piece, cache=False).stream(context)
+
+
+def process_file(input_path, output_path, context, debug, chunk_size=None):
+    from .sigil import Sigil
+    if chunk_size is None and os.path.getsize(input_path) >= LARGE_FILE_SIZE:
+        chunk_size = CHUNK_SIZE
+    if chunk_size:
+        chunks = stream_file(input_path, context, chunk_size)
+        if output_path:
+            write_atomic(output_path, chunks)
+            if debug:
+                print(f"Written output to {output_path}")
+        else:
+            for chunk in chunks:
+                sys.stdout.write(chunk)
+            sys.stdout.write('\n')
+        return
+
     with open(input_path, 'r') as file:
         template = file.read()
     
-    sigil = Sigil(template)
+    sigil = Sigil(template, cache=False)
     result = sigil % context
     
     if output_path:
-        with open(output_path, 'w') as file:
-            file.write(result)
+        write_atomic(output_path, [result])
         if debug:
             print(f"Written output to {output_path}")
     else:
         print(result)
 
 
-def process_directory(directory, context, debug):
-    for root, _, files in os.walk(directory):
-        for filename in files:
+def find_templates(directory):
+    """Yield the path of every %[...]-named template under directory, in sorted order."""
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
             if filename.startswith('%[') and filename.endswith(']'):
-                input_path = os.path.join(root, filename)
-                resolved_name = Sigil(filename).solve(context)
-                if resolved_name == filename:
-                    if debug:
-                        print(f"Skipping {input_path}: filename did not resolve.")
-                    continue
-                output_path = os.path.join(root, resolved_name)
-                process_file(input_path, output_path, context, debug)
+                yield os.path.join(root, filename)
+
+
+# Context of the current worker, set once by init_worker instead of sent with every file
+_worker_context = None
+
+
+def init_worker(context):
+    global _worker_context
+    _worker_context = context
+
+
+MANIFEST_NAME = '.sigils-cache.json'
+
+
+def hash_text(text):
+    import hashlib
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def load_manifest(directory):
+    """Load the incremental manifest of a directory, or an empty one."""
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get('files', {}) if isinstance(manifest, dict) else {}
+
+
+def save_manifest(directory, files):
+    data = json.dumps({'version': 1, 'files': files}, indent=1, sort_keys=True)
+    write_atomic(os.path.join(directory, MANIFEST_NAME), [data])
+
+
+def inputs_unchanged(entry, template_hash, output_name, output_path, context):
+    """Check a manifest entry against the current template and context values."""
+    if not entry or entry.get('template') != template_hash or entry.get('output') != output_name:
+        return False
+    if not os.path.exists(output_path):
+        return False
+    paths = entry.get('paths', {})
+    if not paths:
+        return True
+    from .bundle import SigilSet
+    values = SigilSet([f"%[{path}]" for path in paths]).solve(context)
+    return all(hash_text(value) == digest for value, digest in zip(values, paths.values()))
+
+
+def render_template(input_path, context=None, entry=None, incremental=False):
+    """Render one %[...]-named template next to itself.
+
+    Returns a dict with the input and output paths (output is None if the
+    filename did not resolve), the error message of any failure, whether the
+    output was written and, in incremental mode, the new manifest entry.
+    """
+    from .sigil import Sigil
+    if context is None:
+        context = _worker_context
+    result = {'input': input_path, 'output': None, 'error': None, 'written': False, 'entry': None}
+    try:
+        filename = os.path.basename(input_path)
+        resolved_name = Sigil(filename).solve(context)
+        if resolved_name == filename:
+            return result
+        output_path = os.path.join(os.path.dirname(input_path), resolved_name)
+        result['output'] = output_path
+        if not incremental:
+            process_file(input_path, output_path, context, False)
+            result['written'] = True
+            return result
+
+        with open(input_path, 'r') as file:
+            template = file.read()
+        template_hash = hash_text(template)
+        if inputs_unchanged(entry, template_hash, resolved_name, output_path, context):
+            result['entry'] = entry
+            return result
+        output, values = Sigil(template, cache=False).solve_traced(context)
+        output_hash = hash_text(output)
+        if not (entry and entry.get('output_hash') == output_hash and os.path.exists(output_path)):
+            try:
+                with open(output_path, 'r') as file:
+                    unchanged = file.read() == output
+            except (OSError, ValueError):
+                unchanged = False
+            if not unchanged:
+                write_atomic(output_path, [output])
+                result['written'] = True
+        result['entry'] = {
+            'template': template_hash,
+            'output': resolved_name,
+            'output_hash': output_hash,
+            'paths': {path: hash_text(value) for path, value in values.items()},
+        }
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def process_directory(directory, context, debug, jobs=1, threads=False, incremental=False):
+    """Render every template in a directory tree, optionally with a pool of workers.
+
+    Results are reported in the same sorted order whatever the number of jobs.
+    In incremental mode a manifest of template and context value hashes is kept
+    in the directory, and templates whose inputs did not change are skipped.
+    Returns a list of (input_path, error) for the files that failed.
+    """
+    import functools
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    templates = list(find_templates(directory))
+    manifest = load_manifest(directory) if incremental else {}
+    names = [os.path.relpath(path, directory) for path in templates]
+    entries = [manifest.get(name) for name in names]
+    render = functools.partial(render_template, incremental=incremental)
+    if jobs > 1 and len(templates) > 1:
+        pool = ThreadPoolExecutor if threads else ProcessPoolExecutor
+        with pool(max_workers=jobs, initializer=init_worker, initargs=(context,)) as executor:
+            chunksize = 1 if threads else max(1, len(templates) // (jobs * 4))
+            results = list(executor.map(render, templates, [None] * len(templates), entries,
+                                        chunksize=chunksize))
+    else:
+        results = [render(path, context, entry=entry) for path, entry in zip(templates, entries)]
+
+    errors = []
+    files = {}
+    for name, result in zip(names, results):
+        input_path, output_path, error = result['input'], result['output'], result['error']
+        if result['entry'] is not None:
+            files[name] = result['entry']
+        if error:
+            errors.append((input_path, error))
+            print(f"Error rendering {input_path}: {error}", file=sys.stderr)
+        elif debug:
+            if output_path is None:
+                print(f"Skipping {input_path}: filename did not resolve.")
+            elif result['written']:
+                print(f"Written output to {output_path}")
+            else:
+                print(f"Unchanged {output_path}")
+    if incremental and files != manifest:
+        save_manifest(directory, files)
+    return errors
+
+
+def forward(socket_path, args):
+    """Send a render to the daemon. Returns False if it must be done locally instead."""
+    if args.test or args.benchmark or args.watch or args.seed is not None:
+        return False
+    if args.file and (os.path.isdir(args.file) or args.large or args.chunk_size):
+        return False
+    payload = {
+        'text': args.text,
+        'expression': args.expression,
+        'context': os.path.abspath(args.context) if args.context else None,
+        'values': args.value,
+        'max_depth': args.max_depth,
+    }
+    if args.file:
+        payload['file'] = os.path.abspath(args.file)
+        output_path = args.file if args.overwrite else args.write
+        payload['write'] = os.path.abspath(output_path) if output_path else None
+    from .daemon import request
+    try:
+        response = request(socket_path, payload)
+    except (OSError, ValueError) as e:
+        if args.debug:
+            print(f"Daemon unavailable ({e}), solving locally.", file=sys.stderr)
+        return False
+    if not response.get('ok'):
+        print(response.get('error'), file=sys.stderr)
+        sys.exit(1)
+    if response.get('result') is not None:
+        print(response['result'])
+    elif args.debug:
+        print(f"Written output to {payload['write']}")
+    return True
 
 
 def main():
@@ -64,16 +358,45 @@ def main():
     parser.add_argument("--max-depth", "-d", type=int, default=6, help="Maximum recursion depth.")
     parser.add_argument("--value", "-v", action='append', default=[], help='Additional context entries in KEY=VALUE format.')
     parser.add_argument("--test", action='store_true', help="Run test suite.")
-    parser.add_argument("--benchmark", action='store_true', help="Run benchmark.")
+    parser.add_argument("--benchmark", action='store_true', help="Run benchmark (results go to --write as JSON).")
+    parser.add_argument("--baseline", help="Benchmark JSON results to compare against.")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Slowdown ratio reported as a regression (default 0.10).")
+    parser.add_argument("--scenario", action='append', default=[], help="Only run the named benchmark scenario.")
     parser.add_argument("--seed", type=int, default=None, help="Seed for random number generation.")
     parser.add_argument("--write", "--output", "--outfile", "--target", "-w", help="Write output to file.")
     parser.add_argument("--overwrite", "--replace", "-o", "-r", action='store_true', help="Overwrite input file.")
     parser.add_argument("--debug", "-b", action='store_true', help="Print debug output.")
+    parser.add_argument("--watch", action='store_true', help="Keep running and re-render when templates or context change.")
+    parser.add_argument("--interval", type=float, default=1.0, help="Seconds between checks in --watch mode.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Render directory files with N parallel workers.")
+    parser.add_argument("--incremental", action='store_true', help=f"Skip directory files whose inputs did not change (keeps {MANIFEST_NAME}).")
+    parser.add_argument("--threads", action='store_true', help="Use threads instead of processes for --jobs.")
+    parser.add_argument("--large", action='store_true', help="Stream the file in chunks (automatic for big files).")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Chunk size in characters for --large.")
+    parser.add_argument("--lazy", action='store_true', default=None, help="Read the JSON context lazily through an offset index (automatic for big files).")
+    parser.add_argument("--serve", action='store_true', help="Run a daemon that solves requests from other sigils calls.")
+    parser.add_argument("--socket", help="Unix socket of the daemon (default: $SIGILS_SOCKET).")
     
-    args = parser.parse_args()
+    argv = sys.argv[1:]
+    if argv[:1] == ['serve']:
+        argv = ['--serve'] + argv[1:]
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        from .daemon import serve
+        serve(args.socket)
+        return
+
+    # Client mode: forward plain renders to a running daemon, if one was named
+    socket_path = args.socket or os.environ.get('SIGILS_SOCKET')
+    if socket_path and forward(socket_path, args):
+        return
+
+    from .sigil import Sigil
     Sigil.debug = args.debug
     
     if args.seed is not None:
+        import random
         random.seed(args.seed)
     
     try:
@@ -85,31 +408,52 @@ def main():
     
     if args.test:
         import unittest
-        from .tests import TestSigil
-        suite = unittest.defaultTestLoader.loadTestsFromTestCase(TestSigil)
+        from . import tests
+        suite = unittest.defaultTestLoader.loadTestsFromModule(tests)
         unittest.TextTestRunner().run(suite)
         return
     
     if args.benchmark:
         from .benchmark import run_benchmark
-        run_benchmark(debug=args.debug)
+        _, regressions = run_benchmark(
+            only=args.scenario, output=args.write, baseline=args.baseline,
+            threshold=args.threshold, debug=args.debug)
+        if regressions:
+            sys.exit(1)
         return
     
-    context = load_context(args.context)
-    for entry in args.value:
-        key, value = entry.split('=', 1)
-        context[key] = value
+    def load():
+        context = load_context(args.context, args.lazy)
+        for entry in args.value:
+            key, value = entry.split('=', 1)
+            context[key] = value
+        return context
+
+    if args.watch and args.file:
+        from .watch import Watcher
+        # Overwriting the template would feed the output back into the watcher
+        output_path = args.write
+        Watcher(args.file, load, context_file=args.context, output_path=output_path,
+                interval=args.interval, debug=args.debug).run()
+        return
+
+    context = load()
     
     if args.file:
         if os.path.isdir(args.file):
-            process_directory(args.file, context, args.debug)
+            errors = process_directory(args.file, context, args.debug, args.jobs, args.threads, args.incremental)
+            if errors:
+                sys.exit(1)
         else:
             output_path = args.file if args.overwrite else args.write
-            process_file(args.file, output_path, context, args.debug)
+            chunk_size = args.chunk_size or (CHUNK_SIZE if args.large else None)
+            process_file(args.file, output_path, context, args.debug, chunk_size)
     else:
         text = args.text if not args.expression else f"{args.text}%[{args.expression}]"
-        result = Sigil(text, debug=debug) % context
+        result = Sigil(text, debug=args.debug, max_depth=args.max_depth) % context
         print(result)
+        if args.debug:
+            print(json.dumps(Sigil.stats(), indent=2), file=sys.stderr)
     
     
 if __name__ == "__main__":
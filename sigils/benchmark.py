@@ -1,34 +1,213 @@
+import sys
+import json
 import time
-from sigils import Sigil
-
-def run_benchmark(*, n=10000, debug=False):
-    # Define a complex context
-    complex_context = {
-        "user": {
-            "name": "Alice",
-            "friends": [{"name": "Bob"}, {"name": "Charlie"}, {"name": "Dave"}],
-            "greet": lambda name: f"Hello, {name}!"
-        },
-        "numbers": list(range(1000))
+import string
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+from .sigil import Sigil
+
+# A scenario is slower than its baseline when its median grows more than this
+DEFAULT_THRESHOLD = 0.10
+
+
+class Scenario:
+    """One template and context to time, with optional str.format / string.Template equivalents.
+
+    `format` is a (template, kwargs) pair for str.format and `substitute` a
+    (template, mapping) pair for string.Template, both producing the same text.
+    `threads` renders from that many threads at once and times the whole batch.
+    `compiled` times the code-generated render function instead of the resolver.
+    """
+
+    def __init__(self, name, template, context, *, format=None, substitute=None, threads=0, cache=True,
+                 compiled=False):
+        self.name = name
+        self.template = template
+        self.context = context
+        self.format = format
+        self.substitute = substitute
+        self.threads = threads
+        self.cache = cache
+        self.compiled = compiled
+
+    def targets(self):
+        """Yield (label, callable) pairs to time for this scenario."""
+        template, context = self.template, self.context
+        if self.threads:
+            sigil = Sigil(template)
+            pool = ThreadPoolExecutor(self.threads)
+            contexts = [context] * (self.threads * 4)
+
+            def render():
+                return list(pool.map(sigil.solve, contexts))
+
+            yield "sigils", render
+            return
+        if self.cache:
+            sigil = Sigil(template, compiled=self.compiled)
+            yield "sigils", lambda: sigil % context
+        else:
+            yield "sigils", lambda: Sigil(template, cache=False) % context
+        if self.format:
+            text, kwargs = self.format
+            yield "str.format", lambda: text.format(**kwargs)
+        if self.substitute:
+            text, mapping = self.substitute
+            substitute = string.Template(text).substitute
+            yield "string.Template", lambda: substitute(mapping)
+
+
+def scenarios():
+    """The standard benchmark scenarios."""
+    user = {"name": "Alice", "email": "alice@example.com", "city": "Monterrey"}
+    words = {f"k{i}": f"value {i}" for i in range(200)}
+    nested = {"a0": "end"}
+    for i in range(1, 6):
+        nested[f"a{i}"] = f"%[a{i - 1}]"
+    items = {"numbers": list(range(10000)),
+             "friends": [{"name": f"Friend {i}"} for i in range(1000)]}
+    calls = {
+        "user": {"name": "Alice", "greet": lambda name: f"Hello, {name}!"},
+        "now": lambda: "12:00",
     }
 
-    # Define the templates
-    complex_template = """
-        Hello, %[user.name]! You have %[user.friends.length] friends. 
-        Your first friend is %[user.friends.0.name]. Number 500 is %[numbers.500].
-        Your friends are: %[user.friends.0.name], %[user.friends.1.name], %[user.friends.2.name].
-        Your last friend was %[user.friends.-1.name]. Second to last was %[user.friends.-2.name].
+    small = "Hi %[user.name], we will write to %[user.email] in %[user.city]."
+    many = " ".join(f"%[k{i}]" for i in range(200))
+    paragraph = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20
+    big = (paragraph + "%[user.name] ") * 50
+
+    return [
+        Scenario("small", small, {"user": user},
+                 format=("Hi {user[name]}, we will write to {user[email]} in {user[city]}.", {"user": user}),
+                 substitute=("Hi $name, we will write to $email in $city.", user)),
+        Scenario("small-compiled", small, {"user": user}, compiled=True,
+                 format=("Hi {user[name]}, we will write to {user[email]} in {user[city]}.", {"user": user})),
+        Scenario("small-uncached", small, {"user": user}, cache=False),
+        Scenario("large-template", big, {"user": user},
+                 format=((paragraph + "{user[name]} ") * 50, {"user": user}),
+                 substitute=((paragraph + "$name ") * 50, user)),
+        Scenario("many-sigils", many, words,
+                 format=(" ".join(f"{{k{i}}}" for i in range(200)), words),
+                 substitute=(" ".join(f"$k{i}" for i in range(200)), words)),
+        Scenario("duplicate-sigils", "%[user.name] " * 200, {"user": user},
+                 format=("{user[name]} " * 200, {"user": user}),
+                 substitute=("$name " * 200, user)),
+        Scenario("nesting", "%[a5]", nested),
+        Scenario("function-calls", "%[user.greet user.name] at %[now]", calls),
+        Scenario("tool-chains", "%[user.name.upper.reverse.lower] %[user.email.before %@] %[user.city.title.zfill %12]", {"user": user}),
+        Scenario("large-lists", "%[numbers.5000] %[numbers.-1] %[friends.500.name] %[friends.-1.name]", items),
+        Scenario("threads", small, {"user": user}, threads=4),
+    ]
+
+
+def percentile(values, fraction):
+    """Linearly interpolated percentile of a sorted list."""
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
 
+def measure(func, *, number, repeat, warmup):
+    """Time `func` and return per-call statistics in seconds.
+
+    Runs `warmup` untimed calls, then `repeat` timed batches of `number` calls.
     """
+    for _ in range(warmup):
+        func()
+    timer = time.perf_counter
+    samples = []
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        samples.append((timer() - start) / number)
+    samples.sort()
+    return {
+        "min": samples[0],
+        "median": percentile(samples, 0.5),
+        "p90": percentile(samples, 0.9),
+        "p99": percentile(samples, 0.99),
+        "max": samples[-1],
+        "mean": sum(samples) / len(samples),
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Return the (scenario, target, old, new) medians that regressed past the threshold."""
+    regressions = []
+    old_scenarios = baseline.get("scenarios", {})
+    for name, targets in results["scenarios"].items():
+        for target, stats in targets.items():
+            old = old_scenarios.get(name, {}).get(target)
+            if old and stats["median"] > old["median"] * (1 + threshold):
+                regressions.append((name, target, old["median"], stats["median"]))
+    return regressions
+
+
+def _format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f}{unit}"
+    return f"{seconds / 1e-9:.0f}ns"
+
+
+def run_benchmark(*, n=1000, repeat=20, warmup=None, only=None, output=None,
+                  baseline=None, threshold=DEFAULT_THRESHOLD, debug=False, file=None):
+    """Run the benchmark scenarios and print a summary.
+
+    Each target is called `n` times per repeat, so percentiles are taken over
+    `repeat` samples. `only` limits the run to the named scenarios. Results are
+    written as JSON to `output` if given, and compared against the JSON results
+    in `baseline`. Returns the results and the list of regressions.
+    """
+    file = file or sys.stdout
+    warmup = max(n // 10, 1) if warmup is None else warmup
+    results = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "number": n,
+        "repeat": repeat,
+        "scenarios": {},
+    }
+    for scenario in scenarios():
+        if only and scenario.name not in only:
+            continue
+        timings = results["scenarios"][scenario.name] = {}
+        # Batches of thread renders are much slower than a single render
+        number = max(n // 20, 1) if scenario.threads else n
+        for target, func in scenario.targets():
+            if debug:
+                print(f"Running {scenario.name} ({target})", file=file)
+            timings[target] = measure(func, number=number, repeat=repeat, warmup=warmup)
+
+    print(f"{'scenario':<18} {'target':<16} {'median':>10} {'p90':>10} {'p99':>10} {'sigils/ref':>10}", file=file)
+    for name, timings in results["scenarios"].items():
+        own = timings["sigils"]["median"]
+        for target, stats in timings.items():
+            ratio = f"{own / stats['median']:.2f}x" if target != "sigils" else ""
+            print(f"{name:<18} {target:<16} {_format_time(stats['median']):>10} "
+                  f"{_format_time(stats['p90']):>10} {_format_time(stats['p99']):>10} {ratio:>10}", file=file)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if baseline:
+        with open(baseline, 'r') as f:
+            regressions = compare(results, json.load(f), threshold)
+        for name, target, old, new in regressions:
+            print(f"REGRESSION {name} ({target}): {_format_time(old)} -> {_format_time(new)} "
+                  f"(+{(new / old - 1) * 100:.0f}%)", file=file)
+        if not regressions:
+            print(f"No regressions over {threshold * 100:.0f}% against {baseline}.", file=file)
+    return results, regressions
+
 
-    # Create Sigil instances
-    complex_sigil = Sigil(complex_template)
-
-    # Time the complex interpolation
-    start = time.time()
-    result = ""
-    for _ in range(n):
-        result = complex_sigil % complex_context
-    end = time.time()
-    print(f"Complex sigil interpolation took {end - start:.2f} seconds for {n} interpolations.")
-    print(result)
+__all__ = ["Scenario", "scenarios", "measure", "percentile", "compare", "run_benchmark"]
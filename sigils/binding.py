@@ -0,0 +1,94 @@
+import types
+import inspect
+import weakref
+
+from .cache import LRUCache
+
+_POSITIONAL = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+
+
+class Binding:
+    """How to call one function from a sigil, worked out once from its signature.
+
+    `positional` is the number of positional parameters (None if the signature
+    cannot be inspected), `required` how many of them have no default, and
+    `varargs` whether it also accepts *args.
+    """
+
+    __slots__ = ("positional", "required", "varargs", "_bound")
+
+    def __init__(self, positional, required, varargs):
+        self.positional = positional
+        self.required = required
+        self.varargs = varargs
+        self._bound = None
+
+    @classmethod
+    def of(cls, func):
+        try:
+            signature = inspect.signature(func)
+        except (TypeError, ValueError):
+            return cls(None, 0, True)
+        positional = required = 0
+        varargs = False
+        for param in signature.parameters.values():
+            if param.kind in _POSITIONAL:
+                positional += 1
+                if param.default is param.empty:
+                    required += 1
+            elif param.kind is param.VAR_POSITIONAL:
+                varargs = True
+        return cls(positional, required, varargs)
+
+    def bound(self):
+        """The binding of the same function once bound to an instance (minus self)."""
+        if self._bound is None:
+            if self.positional is None:
+                self._bound = self
+            else:
+                self._bound = Binding(
+                    max(self.positional - 1, 0), max(self.required - 1, 0), self.varargs)
+        return self._bound
+
+    def arguments(self, value, args, chained=False):
+        """Return the positional arguments for a call.
+
+        Without sigil arguments the current value is passed if the function takes
+        any positional parameter. A chained call (a tool applied to a value, as in
+        %[name.first 3]) always gets the value first, followed by the arguments.
+        Otherwise the value is only put first when the arguments alone do not fill
+        the required parameters. Extra arguments are dropped.
+        """
+        if not args:
+            return (value,) if self.positional else ()
+        if chained or (self.positional is not None and len(args) < self.required):
+            args = (value, *args)
+        if self.positional is not None and not self.varargs:
+            args = args[:self.positional]
+        return args
+
+
+# Bindings of weakly referenceable callables go away with them; the rest
+# (builtins, C methods) are kept in a bounded cache keyed by identity.
+_bindings = weakref.WeakKeyDictionary()
+_other_bindings = LRUCache(maxsize=1024)
+
+
+def binding_for(func):
+    """Return the cached Binding for a callable, building it on first use."""
+    bound = isinstance(func, types.MethodType)
+    target = func.__func__ if bound else func
+    try:
+        binding = _bindings.get(target)
+        if binding is None:
+            binding = _bindings[target] = Binding.of(target)
+    except TypeError:
+        entry = _other_bindings.get(id(target))
+        if entry is None or entry[0] is not target:
+            entry = (target, Binding.of(target))
+            _other_bindings.put(id(target), entry)
+        binding = entry[1]
+    return binding.bound() if bound else binding
+
+
+__all__ = ["Binding", "binding_for"]
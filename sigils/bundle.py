@@ -0,0 +1,75 @@
+from collections.abc import Mapping
+
+from .sigil import Sigil, _Render, _hook, _prefetchers
+from .parser import compile_template, required_paths
+
+
+class SigilSet:
+    """A bundle of templates solved together against the same context.
+
+    Every distinct sigil across all templates is resolved once per solve, then
+    each template is assembled from the shared results.
+    """
+
+    def __init__(self, templates, **options):
+        """
+        Initialize a new SigilSet.
+
+        Args:
+            templates (dict or list): Templates to solve, either a mapping of
+                names to templates or a sequence of templates.
+            **options: Settings passed to Sigil (brackets, max_depth, ...).
+        """
+        if isinstance(templates, Mapping):
+            self.names = list(templates.keys())
+            templates = list(templates.values())
+        else:
+            self.names = None
+            templates = list(templates)
+        self.templates = templates
+        self.solver = Sigil("", **options)
+        self.plans = [compile_template(t, self.solver.brackets) for t in templates]
+
+        # Merged index of every distinct expression, with the plan it came from
+        index = {}
+        for plan in self.plans:
+            for expression in plan.unique:
+                index.setdefault(expression.text, (expression, plan))
+        self.index = index
+
+    def sigils(self):
+        """Return the distinct sigils across all templates, in order of appearance."""
+        return list(self.index.keys())
+
+    def required_paths(self):
+        """Return the distinct key paths across all templates (see Sigil.required_paths())."""
+        return list(dict.fromkeys(path for plan in self.plans for path in required_paths(plan)))
+
+    def solve(self, context):
+        """Solve all templates. Returns a dict if templates were named, else a list."""
+        render = _Render(context if context is not None else {})
+        prefetch = _prefetchers.get(type(render.context))
+        if prefetch is None:
+            prefetch = _hook(_prefetchers, type(render.context), '__sigil_prefetch__')
+        if prefetch is not False:
+            prefetch(render.context, self.required_paths())
+        solver = self.solver
+        if solver.executor is not None and len(self.index) > 1:
+            solver._solve_concurrently(list(self.index.values()), render)
+        else:
+            for expression, plan in self.index.values():
+                solver._solve_expression(expression, plan, render, 0)
+        results = [solver._assemble(plan, render.memo) for plan in self.plans]
+        if self.names is not None:
+            return dict(zip(self.names, results))
+        return results
+
+    def __mod__(self, context):
+        """Operator overload for the modulus (%) operator. Same as solve method."""
+        return self.solve(context or {})
+
+    def __len__(self):
+        return len(self.plans)
+
+
+__all__ = ["SigilSet"]
@@ -0,0 +1,173 @@
+from .tools import tools, purity
+from .binding import binding_for
+from .registry import LazyTool
+
+# Types a compiled sigil may solve to; anything else goes through the resolver
+_PLAIN = (str, int, float, bool)
+
+_MISSING = object()
+
+# Stands in for the chained value while binding a tool's arguments
+_VALUE = object()
+
+
+class _Writer:
+    """Accumulates the guarded lookups of the generated function and its namespace."""
+
+    def __init__(self):
+        self.lines = []
+        self.names = {"MISSING": _MISSING, "tools": tools}
+        self.constants = {}
+        self.seen = set()
+        # Variables already holding a key path prefix, shared by the expressions
+        self.paths = {}
+        self.counter = 0
+
+    def variable(self):
+        self.counter += 1
+        return f"v{self.counter}"
+
+    def constant(self, prefix, value):
+        """Return the name of a constant in the namespace, adding it once."""
+        name = self.constants.get(id(value))
+        if name is None:
+            self.counter += 1
+            name = self.constants[id(value)] = f"{prefix}{self.counter}"
+            self.names[name] = value
+        return name
+
+    def guard(self, condition):
+        line = f"if {condition}: return fallback(context)"
+        if line not in self.seen:
+            self.seen.add(line)
+            self.lines.append(line)
+
+    def rollback(self, mark, paths):
+        """Drop the lines emitted since len(self.lines) was mark, and the paths they held."""
+        self.seen.difference_update(self.lines[mark:])
+        del self.lines[mark:]
+        for path in paths:
+            del self.paths[path]
+
+
+def _compile_expression(expression, context, writer, left):
+    """Emit the lookups for one expression, following the shape of `context`.
+
+    Returns the variable holding the result, or None if the expression needs
+    the generic resolver (functions, the global context, nested sigils, ...).
+    """
+    from .sigil import _hook, _resolvers
+    if expression.nested is not None:
+        return None
+    emitted, added = len(writer.lines), []
+    value, code = context, "context"
+    path = ()
+    for segment in expression.segments:
+        key = segment.key
+        path += ((key, tuple(arg.text for arg in segment.args)),)
+        if path in writer.paths:
+            code, value = writer.paths[path]
+            continue
+        target = writer.variable()
+        kind = writer.constant("T", type(value))
+        # Objects resolving whole paths with __sigil_resolve__ are left to the resolver;
+        # the class guards keep any other class from taking this code
+        if segment.literal or _hook(_resolvers, type(value), '__sigil_resolve__'):
+            break
+        if isinstance(value, dict) and value and key in value and not segment.args:
+            temp = value[key]
+            if temp is None or callable(temp):
+                break
+            # Another class (or a missing key) would take a different branch of the resolver
+            writer.guard(f"{code}.__class__ is not {kind}")
+            writer.lines.append(f"{target} = {code}.get({key!r}, MISSING)")
+            value = temp
+        elif isinstance(value, list) and key.lstrip("+-").isdigit() and -len(value) <= int(key) < len(value):
+            writer.guard(f"{code}.__class__ is not {kind}")
+            writer.lines.append(f"{target} = {code}[{int(key)}]")
+            value = value[int(key)]
+        elif value is not context and not isinstance(value, (dict, list)) and key in tools:
+            tool = tools[key]
+            if type(tool) is LazyTool:
+                tool = tool.load(tools)
+            # Only pure tools: a guard failing later re-runs the whole render
+            if purity.get(tool) is not True or any(
+                    len(arg.segments) != 1 or not arg.segments[0].literal for arg in segment.args):
+                break
+            args = tuple(arg.segments[0].key for arg in segment.args)
+            name = writer.constant("tool", tool)
+            writer.guard(f"{code}.__class__ is not {kind}")
+            writer.guard(f"tools.get({key!r}) is not {name}")
+            argv = binding_for(tool).arguments(_VALUE, args, True)
+            try:
+                # Pure, so safe to run on the sample: later guards check the type it returns
+                value = tool(*(value if arg is _VALUE else arg for arg in argv))
+            except Exception:
+                break
+            argv = ", ".join(code if arg is _VALUE else repr(arg) for arg in argv)
+            writer.lines.append(f"{target} = {name}({argv})")
+        else:
+            break
+        code = target
+        writer.paths[path] = (code, value)
+        added.append(path)
+    else:
+        if type(value) in _PLAIN and not (type(value) is str and left in value):
+            condition = f"{code}.__class__ is not {writer.constant('T', type(value))}"
+            if type(value) is str:
+                condition += f" or {left!r} in {code}"
+            writer.guard(condition)
+            return code
+    writer.rollback(emitted, added)
+    return None
+
+
+def _escape(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def compile_plan(plan, context, fallback, partial):
+    """Generate a render function specialized for a plan and the shape of a context.
+
+    Key paths that resolve through dicts, lists and chained pure tools in `context`
+    become direct lookups, and the output is assembled with one f-string. Each
+    step is guarded by the class it had in `context`; if a guard fails the
+    function returns fallback(context). Expressions that cannot be compiled are
+    solved by partial(context, expressions), which returns their output text.
+
+    Returns a tuple (function, source).
+    """
+    writer = _Writer()
+    left = plan.brackets[0]
+    variables, generic = {}, []
+    for expression in plan.unique:
+        variable = _compile_expression(expression, context, writer, left)
+        if variable is None:
+            generic.append(expression)
+        else:
+            variables[expression.text] = variable
+
+    lines = ["def make(fallback, partial):", "    def render(context):", "        try:"]
+    lines += [f"            {line}" for line in writer.lines] or ["            pass"]
+    lines += ["        except LookupError:", "            return fallback(context)"]
+    if generic:
+        # Solved last, so functions never run twice when a guard falls back
+        writer.names["GENERIC"] = tuple(generic)
+        lines.append("        rest = partial(context, GENERIC)")
+        for expression in generic:
+            variable = variables[expression.text] = writer.variable()
+            lines.append(f"        {variable} = rest[{expression.text!r}]")
+    pieces = [_escape(plan.literals[0])]
+    for i, expression in enumerate(plan.expressions, 1):
+        pieces.append("{" + variables[expression.text] + "}")
+        pieces.append(_escape(plan.literals[i]))
+    lines.append(f"        return f{''.join(pieces)!r}")
+    lines.append("    return render")
+
+    source = "\n".join(lines) + "\n"
+    namespace = writer.names
+    exec(compile(source, "<sigils compiled template>", "exec"), namespace)
+    return namespace["make"](fallback, partial), source
+
+
+__all__ = ["compile_plan"]
@@ -1,24 +1,208 @@
-import threading
+import weakref
+import contextvars
 
-# TODO: We should be able to directly set the global context without using it as a manager
+from .cache import LRUCache
+
+class _Layers:
+    """An immutable stack of context layers with a lazily built flattened view.
+
+    Layers are merged into a single read-only dict the first time the stack is
+    used, with process defaults at the bottom and the innermost layer on top,
+    so lookups never walk the chain.
+    """
+
+    __slots__ = ("layers", "_flat", "_version")
+
+    def __init__(self, layers=()):
+        self.layers = layers
+        self._flat = None
+        self._version = None
+
+    def push(self, layer):
+        return _Layers(self.layers + (layer,))
+
+    def flat(self):
+        if self._flat is None or self._version != Context._version:
+            version = Context._version
+            merged = dict(Context._defaults)
+            for layer in self.layers:
+                merged.update(layer)
+            self._flat, self._version = FrozenContext(merged), version
+        return self._flat
 
 
 class Context:
-    _context = threading.local()
+    """The global context, consulted when a sigil does not resolve in the local one.
+
+    It is kept in a context variable, so each thread and each asyncio task sees
+    its own value. Layers nest: a request layer pushed over a tenant layer
+    overrides its keys and falls back to it (and to the process defaults) for
+    the rest.
+
+        Context.set_defaults({"site": "example.com"})   # every thread and task
+        Context.set({"tenant": "acme"})                  # the current task
+        with Context({"user": "alice"}):                 # a nested layer
+            Sigil("%[user]@%[site]") % {}
+    """
+
+    _current = contextvars.ContextVar("sigils_context", default=_Layers())
+    _defaults = {}
+    _version = 0
 
     def __init__(self, context):
         self.local_context = context
 
     def __enter__(self):
-        self.old_context = getattr(self._context, 'value', {})
-        self._context.value = self.local_context
-        return self._context.value
+        """Push the layer and return the read-only view that sigils will see.
+
+        Lookups go through a flattened copy of the layers, so changes to the
+        layer dict inside the block would be ignored; the view raises instead.
+        """
+        self._token = self.push(self.local_context)
+        return self.current()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._context.value = self.old_context
+        self.reset(self._token)
+
+    @classmethod
+    def set(cls, context):
+        """Replace the global context of the current thread or task with a single layer."""
+        return cls._current.set(_Layers((context,)))
+
+    @classmethod
+    def push(cls, context):
+        """Add a layer over the current global context. Returns a token for reset()."""
+        return cls._current.set(cls._current.get().push(context))
+
+    @classmethod
+    def reset(cls, token):
+        """Restore the global context as it was before set() or push() returned token."""
+        cls._current.reset(token)
+
+    @classmethod
+    def clear(cls):
+        """Remove every layer of the current thread or task (defaults remain)."""
+        return cls._current.set(_Layers())
+
+    @classmethod
+    def set_defaults(cls, defaults):
+        """Set the process-wide bottom layer shared by every thread and task."""
+        cls._defaults = dict(defaults)
+        cls._version += 1
+
+    @classmethod
+    def current(cls):
+        """Return the flattened, read-only view of the current global context."""
+        return cls._current.get().flat()
+
+    @classmethod
+    def lookup(cls, key, default=None):
+        """Find a key in the global context, falling back to a case-insensitive match."""
+        flat = cls._current.get().flat()
+        if key in flat:
+            return flat[key]
+        actual = casefold_key(flat, key) if flat else None
+        return flat[actual] if actual is not None else default
+
+    @staticmethod
+    def freeze(context):
+        """Return a read-only copy of a context for fast case-insensitive lookups."""
+        return freeze(context)
+
+
+class FrozenContext(dict):
+    """A read-only dict whose lowercase key index is built once and never invalidated."""
+
+    __slots__ = ("_lower",)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("FrozenContext is read-only")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return (FrozenContext, (dict(self),))
+
+    def lower_index(self):
+        try:
+            return self._lower
+        except AttributeError:
+            self._lower = _build_index(self)
+            return self._lower
+
+
+def freeze(value):
+    """Return a FrozenContext copy of a mapping, freezing nested dicts too."""
+    if isinstance(value, FrozenContext):
+        return value
+    if isinstance(value, dict):
+        return FrozenContext((k, freeze(v)) for k, v in value.items())
+    return value
+
+
+def _build_index(mapping):
+    index = {}
+    for key in mapping:
+        if isinstance(key, str):
+            index.setdefault(key.lower(), key)
+    return index
+
+
+# Lowercase indexes of mutable dicts, keyed by identity, with the size each was
+# built at. Mappings that can be weakly referenced (dict subclasses, lazy JSON
+# objects) are tracked weakly and their entry goes away with them. Plain dicts
+# cannot be, so a small LRU keeps the last few of them alive instead.
+indexes = LRUCache(maxsize=32)
+_weak_indexes = {}
+
+
+def _forget(ref, key):
+    entry = _weak_indexes.get(key)
+    if entry is not None and entry[0] is ref:
+        del _weak_indexes[key]
+
+
+def _cached_index(mapping):
+    key = id(mapping)
+    if type(mapping).__weakrefoffset__:
+        entry = _weak_indexes.get(key)
+        if entry is None or entry[0]() is not mapping or entry[1] != len(mapping):
+            ref = weakref.ref(mapping, lambda ref: _forget(ref, key))
+            entry = _weak_indexes[key] = (ref, len(mapping), _build_index(mapping))
+        return entry[2]
+    entry = indexes.get(key)
+    if entry is None or entry[0] is not mapping or entry[1] != len(mapping):
+        entry = (mapping, len(mapping), _build_index(mapping))
+        indexes.put(key, entry)
+    return entry[2]
+
+
+def invalidate(mapping):
+    """Drop the cached lowercase index of a dict after changing its keys in place."""
+    _weak_indexes.pop(id(mapping), None)
+    indexes.put(id(mapping), None)
+
+
+def casefold_key(mapping, key):
+    """Find the actual key of a dict that matches key ignoring case, or None.
+
+    The lowercase index of a mutable dict is rebuilt when its size changes or
+    when the key it points to has been removed; call invalidate() after
+    renaming keys in place. Frozen contexts never need rebuilding.
+    """
+    if isinstance(mapping, FrozenContext):
+        return mapping.lower_index().get(key.lower())
+    lower = key.lower()
+    for _ in range(2):
+        actual = _cached_index(mapping).get(lower)
+        if actual is None or actual in mapping:
+            return actual
+        invalidate(mapping)
+    return None
 
 
 # TODO: Add a "contextual" decorator that resolves default strings and string arguments 
 
 
-__all__ = ["Context"]
+__all__ = ["Context", "FrozenContext", "freeze", "casefold_key", "invalidate"]
@@ -0,0 +1,165 @@
+import os
+import sys
+import json
+import socket
+
+# Only the client half of this module runs for every forwarded call, so it
+# sticks to modules that are cheap to import. The server imports the engine.
+
+SOCKET_VARIABLE = "SIGILS_SOCKET"
+
+
+def default_socket_path():
+    """Per-user socket path, overridable with the SIGILS_SOCKET variable."""
+    path = os.environ.get(SOCKET_VARIABLE)
+    if path:
+        return path
+    tmp = os.environ.get('TMPDIR', '/tmp')
+    return os.path.join(tmp, f"sigils-{os.getuid()}.sock")
+
+
+def request(socket_path, payload, timeout=30):
+    """Send one request to a running daemon and return its decoded response."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(payload).encode('utf-8') + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    return json.loads(b''.join(chunks))
+
+
+class Daemon:
+    """Solve requests from CLI clients while keeping contexts and templates warm.
+
+    Each request is one JSON object per connection: the same fields as the
+    command line (text, expression, context, values, max_depth, file, write).
+    Context and template files are cached and only reloaded when their size
+    or modification time changes. Templates given as text stay in the shared
+    plan cache between requests.
+    """
+
+    def __init__(self, socket_path):
+        from .cache import LRUCache
+        self.socket_path = socket_path
+        self.contexts = {}
+        self.templates = LRUCache(maxsize=256)
+
+    def context(self, path, values):
+        from .__main__ import load_context
+        context = {}
+        if path:
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            cached = self.contexts.get(path)
+            if cached is None or cached[0] != key:
+                try:
+                    cached = (key, load_context(path))
+                except SystemExit:
+                    raise ValueError(f"Unsupported format: {path}")
+                self.contexts[path] = cached
+            context = cached[1]
+        if values:
+            context = dict(context)
+            for entry in values:
+                name, value = entry.split('=', 1)
+                context[name] = value
+        return context
+
+    def template(self, path):
+        """Return the parsed Sigil of a template file, or None if it is large enough to stream."""
+        from .sigil import Sigil
+        from .__main__ import LARGE_FILE_SIZE
+        stat = os.stat(path)
+        if stat.st_size >= LARGE_FILE_SIZE:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size)
+        cached = self.templates.get(path)
+        if cached is None or cached[0] != key:
+            with open(path, 'r') as file:
+                cached = (key, Sigil(file.read(), cache=False))
+            self.templates.put(path, cached)
+        return cached[1]
+
+    def handle(self, payload):
+        """Process one decoded request and return the response object."""
+        from .sigil import Sigil
+        from .__main__ import process_file, write_atomic
+        try:
+            context = self.context(payload.get('context'), payload.get('values'))
+            path = payload.get('file')
+            if path:
+                output_path = payload.get('write')
+                sigil = self.template(path)
+                if sigil is None:
+                    if output_path:
+                        process_file(path, output_path, context, False)
+                        return {'ok': True, 'result': None}
+                    with open(path, 'r') as file:
+                        sigil = Sigil(file.read(), cache=False)
+                if output_path:
+                    write_atomic(output_path, [sigil % context])
+                    return {'ok': True, 'result': None}
+                return {'ok': True, 'result': sigil % context}
+            text = payload.get('text', '')
+            if payload.get('expression'):
+                text = f"{text}%[{payload['expression']}]"
+            sigil = Sigil(text, max_depth=payload.get('max_depth'))
+            return {'ok': True, 'result': sigil % context}
+        except Exception as e:
+            return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+    def serve_forever(self):
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                try:
+                    payload = json.loads(self.rfile.readline())
+                except ValueError as e:
+                    response = {'ok': False, 'error': f"Invalid request: {e}"}
+                else:
+                    response = daemon.handle(payload)
+                self.wfile.write(json.dumps(response).encode('utf-8'))
+
+        if os.path.exists(self.socket_path):
+            try:
+                request(self.socket_path, {'text': ''}, timeout=1)
+            except OSError:
+                os.unlink(self.socket_path)  # Left behind by a daemon that died
+            else:
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+
+        with socketserver.ThreadingUnixStreamServer(self.socket_path, Handler) as server:
+            os.chmod(self.socket_path, 0o600)
+            server.daemon_threads = True
+            self.server = server
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            finally:
+                if os.path.exists(self.socket_path):
+                    os.unlink(self.socket_path)
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+def serve(socket_path=None):
+    import signal
+    socket_path = socket_path or default_socket_path()
+    # Exit through serve_forever's cleanup so the socket file is removed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Serving sigils on {socket_path}", file=sys.stderr)
+    Daemon(socket_path).serve_forever()
+
+
+__all__ = ["Daemon", "serve", "request", "default_socket_path"]
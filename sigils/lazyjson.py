@@ -0,0 +1,363 @@
+import os
+import re
+import json
+import json.scanner
+import mmap
+import threading
+from array import array
+
+# Containers at least this big (in bytes) keep their member offsets in the
+# index file, so they are never scanned again while the file is unchanged.
+INDEX_THRESHOLD = 64 * 1024
+
+INDEX_VERSION = 1
+
+# Skips values at C speed. Windows of the file are decoded as latin-1, so that
+# character offsets are byte offsets; UTF-8 never uses ASCII bytes inside
+# multibyte characters, so the JSON structure is unchanged.
+_SCANNER = json.scanner.make_scanner(json.JSONDecoder())
+_WINDOW_SIZE = 4 * 1024 * 1024
+
+_STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SPACE = re.compile(rb'[ \t\r\n]*')
+_WHITESPACE = b' \t\r\n'
+
+
+class _Indexer:
+    """Find member offsets in a mapped JSON file."""
+
+    def __init__(self, buf, threshold):
+        self.buf = buf
+        self.threshold = threshold
+        self.members = {}
+        self.window_start = 0
+        self.window = ''
+
+    def text(self, pos, need):
+        """Return the decoded window and the index of pos in it, covering `need` bytes if possible."""
+        window_end = self.window_start + len(self.window)
+        if pos < self.window_start or (pos + need > window_end and window_end < len(self.buf)):
+            self.window_start = pos
+            self.window = self.buf[pos:pos + max(_WINDOW_SIZE, need)].decode('latin-1')
+        return self.window, pos - self.window_start
+
+    def skip(self, pos):
+        """Return the offset just past the value at pos, or None if it is a big container."""
+        need = 64 * 1024
+        while True:
+            text, i = self.text(pos, need)
+            complete = self.window_start + len(text) >= len(self.buf)
+            try:
+                end = _SCANNER(text, i)[1]
+                # A number running to the end of the window may continue past it
+                if end < len(text) or complete:
+                    return self.window_start + end
+            except (StopIteration, ValueError):
+                if complete:
+                    raise ValueError(f"Invalid JSON value at offset {pos}") from None
+            available = len(text) - i
+            if self.buf[pos] in b'{[' and available >= self.threshold:
+                return None
+            need = available * 2
+
+    def space(self, pos):
+        return _SPACE.match(self.buf, pos).end()
+
+    def container(self, start):
+        """Record the members of the container at start; return the offset past it."""
+        buf = self.buf
+        keys = [] if buf[start] == 0x7b else None
+        close = 0x7d if keys is not None else 0x5d
+        starts, ends = array('q'), array('q')
+        pos = self.space(start + 1)
+        if buf[pos] != close:
+            while True:
+                if keys is not None:
+                    match = _STRING.match(buf, pos)
+                    if match is None:
+                        raise ValueError(f"Expected a key at offset {pos}")
+                    keys.append(json.loads(match.group()))
+                    pos = self.space(match.end())
+                    if buf[pos] != 0x3a:
+                        raise ValueError(f"Expected ':' at offset {pos}")
+                    pos = self.space(pos + 1)
+                end = self.skip(pos)
+                if end is None:
+                    end = self.container(pos)
+                starts.append(pos)
+                ends.append(end)
+                pos = self.space(end)
+                if buf[pos] == 0x2c:
+                    pos = self.space(pos + 1)
+                elif buf[pos] == close:
+                    break
+                else:
+                    raise ValueError(f"Expected ',' or a closing bracket at offset {pos}")
+        self.members[start] = (keys, starts, ends)
+        return pos + 1
+
+
+def _scan(buf, start, threshold):
+    """Find the members of the container opening at `start` and of those nested in it.
+
+    Returns (members, end): members maps the offset of each container that is
+    at least `threshold` bytes long (and always the one at `start`) to a tuple
+    (keys, starts, ends), where keys is None for arrays; end is the offset just
+    past the container. Smaller values are skipped by the C JSON scanner.
+    """
+    indexer = _Indexer(buf, threshold)
+    end = indexer.container(start)
+    return indexer.members, end
+
+
+class _Source:
+    """The mapped file and the member offsets found so far."""
+
+    def __init__(self, buf, members):
+        self.buf = buf
+        self.members = members
+        self.lock = threading.RLock()
+
+    def scan(self, start):
+        entry = self.members.get(start)
+        if entry is None:
+            entry = _scan(self.buf, start, float('inf'))[0][start]
+        return entry
+
+    def value(self, start, end):
+        """Decode a member: scalars right away, containers as lazy views."""
+        while self.buf[start] in _WHITESPACE:
+            start += 1
+        first = self.buf[start]
+        if first == 0x7b:
+            return LazyObject(self, start)
+        if first == 0x5b:
+            return LazyArray(self, start)
+        return json.loads(self.buf[start:end])
+
+
+def _ready(value):
+    if isinstance(value, (LazyObject, LazyArray)) and not value._loaded:
+        value._load()
+    return value
+
+
+class LazyObject(dict):
+    """A JSON object from a mapped file, whose members are read on first access.
+
+    Nested objects and arrays stay lazy until they are looked up themselves.
+    Values handed out by lookups are always loaded, so they behave like plain
+    dicts and lists. Use materialize() to get plain data for a whole subtree.
+    """
+
+    __slots__ = ("_source", "_start", "_loaded", "__weakref__")
+
+    def __init__(self, source, start):
+        super().__init__()
+        self._source = source
+        self._start = start
+        self._loaded = False
+
+    def _load(self):
+        with self._source.lock:
+            if self._loaded:
+                return
+            keys, starts, ends = self._source.scan(self._start)
+            value = self._source.value
+            for key, start, end in zip(keys, starts, ends):
+                # Keys set before loading (e.g. --value overrides) win
+                dict.setdefault(self, key, value(start, end))
+            self._loaded = True
+
+    def materialize(self):
+        """Decode the whole object into plain dicts and lists."""
+        buf = self._source.buf
+        return json.loads(buf[self._start:_scan(buf, self._start, float('inf'))[1]])
+
+    def __getitem__(self, key):
+        self._loaded or self._load()
+        return _ready(dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        self._loaded or self._load()
+        return _ready(dict.get(self, key, default))
+
+    def __contains__(self, key):
+        self._loaded or self._load()
+        return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._loaded or self._load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self._loaded or self._load()
+        return dict.__len__(self)
+
+    def keys(self):
+        self._loaded or self._load()
+        return dict.keys(self)
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __eq__(self, other):
+        self._loaded or self._load()
+        return dict(self.items()) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class LazyArray(list):
+    """A JSON array from a mapped file, whose items are read on first access.
+
+    Indexing only decodes the item asked for; iterating, slicing or comparing
+    decodes every item (nested containers still stay lazy).
+    """
+
+    __slots__ = ("_source", "_start", "_loaded", "_offsets", "_items", "_filled")
+
+    def __init__(self, source, start):
+        super().__init__()
+        self._source = source
+        self._start = start
+        self._loaded = False
+        self._filled = False
+        self._items = {}
+
+    def _load(self):
+        with self._source.lock:
+            if not self._loaded:
+                _, starts, ends = self._source.scan(self._start)
+                self._offsets = (starts, ends)
+                self._loaded = True
+
+    def _item(self, index):
+        item = self._items.get(index)
+        if item is None:
+            with self._source.lock:
+                item = self._items.get(index)
+                if item is None:
+                    starts, ends = self._offsets
+                    item = self._items[index] = self._source.value(starts[index], ends[index])
+        return item
+
+    def _fill(self):
+        self._loaded or self._load()
+        with self._source.lock:
+            if not self._filled:
+                list.extend(self, [self._item(i) for i in range(len(self._offsets[0]))])
+                self._filled = True
+
+    materialize = LazyObject.materialize
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            self._fill()
+            return [_ready(value) for value in list.__getitem__(self, index)]
+        self._loaded or self._load()
+        size = len(self._offsets[0])
+        index = index.__index__()
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("list index out of range")
+        return _ready(self._item(index))
+
+    def __iter__(self):
+        self._fill()
+        return (_ready(value) for value in list.__iter__(self))
+
+    def __len__(self):
+        self._loaded or self._load()
+        return len(self._offsets[0])
+
+    def __contains__(self, value):
+        return any(item == value for item in self)
+
+    def __eq__(self, other):
+        return list(self) == other
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def index_path(path):
+    """Where the member index of a JSON file is kept."""
+    directory, name = os.path.split(os.path.abspath(path))
+    return os.path.join(directory, f".{name}.sigils-index")
+
+
+def _read_index(path, stat):
+    try:
+        with open(index_path(path), 'r') as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if (data.get("version") != INDEX_VERSION or data.get("size") != stat.st_size
+            or data.get("mtime_ns") != stat.st_mtime_ns):
+        return None
+    return {int(start): (keys, array('q', starts), array('q', ends))
+            for start, (keys, starts, ends) in data["members"].items()}
+
+
+def _write_index(path, stat, members):
+    data = {
+        "version": INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "members": {str(start): [keys, starts.tolist(), ends.tolist()]
+                    for start, (keys, starts, ends) in members.items()},
+    }
+    target = index_path(path)
+    try:
+        with open(target + ".tmp", 'w') as file:
+            json.dump(data, file)
+        os.replace(target + ".tmp", target)
+    except OSError:
+        pass  # A read-only directory only means rebuilding the index next time
+
+
+def load(path, *, threshold=INDEX_THRESHOLD, persist=True):
+    """Open a JSON file as a lazy context.
+
+    The file is memory-mapped and scanned once to index the members of every
+    container of at least `threshold` bytes. The index is saved next to the
+    file (as .<name>.sigils-index, keyed by its size and modification time),
+    so later loads skip the scan. Values are only decoded when a key path
+    reaches them. A top-level value that is not an object or array is
+    returned decoded.
+    """
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        if stat.st_size == 0:
+            raise ValueError(f"Empty JSON file: {path}")
+        buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    start = 0
+    while buf[start] in _WHITESPACE:
+        start += 1
+    if buf[start] not in b'{[':
+        return json.loads(buf[:])
+    members = _read_index(path, stat) if persist else None
+    if members is None or start not in members:
+        members = _scan(buf, start, threshold)[0]
+        if persist:
+            _write_index(path, stat, members)
+    return _Source(buf, members).value(start, len(buf))
+
+
+__all__ = ["LazyObject", "LazyArray", "load", "index_path", "INDEX_THRESHOLD"]
@@ -0,0 +1,115 @@
+import threading
+
+# Each table keeps at most this many names; the rest are counted under OTHER
+MAX_NAMES = 1024
+OTHER = "<other>"
+
+
+class Trace:
+    """Timings collected during one instrumented render."""
+
+    __slots__ = ("template", "elapsed", "depth", "sigils", "calls", "unresolved", "memo_hits")
+
+    def __init__(self, template):
+        self.template = template
+        self.elapsed = 0.0
+        self.depth = 0
+        self.sigils = {}
+        self.calls = []
+        self.unresolved = []
+        self.memo_hits = 0
+
+    def as_dict(self):
+        """The render as passed to on_render callbacks."""
+        return {
+            "template": self.template,
+            "elapsed": self.elapsed,
+            "depth": self.depth,
+            "sigils": dict(self.sigils),
+            "calls": list(self.calls),
+            "unresolved": list(self.unresolved),
+            "memo_hits": self.memo_hits,
+        }
+
+
+class Recorder:
+    """Process-wide totals of every instrumented render.
+
+    Times are in seconds. Each timed table maps a name (template, sigil, tool
+    or context callable) to its count, total and maximum time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.renders = {"count": 0, "total": 0.0, "max": 0.0}
+            self.templates = {}
+            self.sigils = {}
+            self.tools = {}
+            self.callables = {}
+            self.unresolved = {}
+            self.max_depth = 0
+            self.memo = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _add(table, name, elapsed):
+        entry = table.get(name)
+        if entry is None:
+            if len(table) >= MAX_NAMES:
+                name = OTHER
+                entry = table.get(name)
+            if entry is None:
+                entry = table[name] = {"count": 0, "total": 0.0, "max": 0.0}
+        entry["count"] += 1
+        entry["total"] += elapsed
+        if elapsed > entry["max"]:
+            entry["max"] = elapsed
+
+    def record(self, trace):
+        """Add the timings of one finished render."""
+        with self._lock:
+            renders = self.renders
+            renders["count"] += 1
+            renders["total"] += trace.elapsed
+            renders["max"] = max(renders["max"], trace.elapsed)
+            self._add(self.templates, trace.template, trace.elapsed)
+            for text, elapsed in trace.sigils.items():
+                self._add(self.sigils, text, elapsed)
+            for kind, name, elapsed in trace.calls:
+                self._add(self.tools if kind == "tool" else self.callables, name, elapsed)
+            for text in trace.unresolved:
+                if text in self.unresolved or len(self.unresolved) < MAX_NAMES:
+                    self.unresolved[text] = self.unresolved.get(text, 0) + 1
+            self.max_depth = max(self.max_depth, trace.depth)
+            self.memo["hits"] += trace.memo_hits
+            self.memo["misses"] += len(trace.sigils)
+
+    def snapshot(self):
+        """Return a deep copy of the totals."""
+        with self._lock:
+            copy = lambda table: {name: dict(entry) for name, entry in table.items()}
+            return {
+                "renders": dict(self.renders),
+                "templates": copy(self.templates),
+                "sigils": copy(self.sigils),
+                "tools": copy(self.tools),
+                "callables": copy(self.callables),
+                "unresolved": dict(self.unresolved),
+                "max_depth": self.max_depth,
+                "memo": dict(self.memo),
+            }
+
+
+recorder = Recorder()
+
+
+def hit_rate(stats):
+    """Fraction of lookups that hit, from a dict with hits and misses."""
+    total = stats["hits"] + stats["misses"]
+    return stats["hits"] / total if total else 0.0
+
+
+__all__ = ["Trace", "Recorder", "recorder", "hit_rate", "MAX_NAMES"]
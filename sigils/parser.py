@@ -0,0 +1,277 @@
+from .cache import LRUCache
+
+# Compiled plans shared by every Sigil in the process, keyed by (template, brackets)
+plans = LRUCache(maxsize=1024)
+
+# Parsed expressions for the text that nested sigils expand to
+expressions = LRUCache(maxsize=4096)
+
+# Written before a left bracket to keep it as literal text: \%[not a sigil]
+ESCAPE = "\\"
+
+
+class Segment:
+    """One dot-separated step of a key path, e.g. `greet` in `user.greet name`.
+
+    `args` holds the parsed argument expressions passed if the step is a function.
+    """
+
+    __slots__ = ("key", "args", "literal")
+
+    def __init__(self, key, args=(), literal=False):
+        self.key = key
+        self.args = args
+        self.literal = literal
+
+    def __repr__(self):
+        return f"Segment({self.key!r}, args={self.args!r}, literal={self.literal!r})"
+
+
+class Expression:
+    """The parsed contents of a single %[sigil].
+
+    If the sigil has sigils inside (%[user.%[field]]), `nested` is the Plan of
+    its text and `segments` is None: the inner sigils are solved first and the
+    text they produce is parsed with expression_for().
+    """
+
+    __slots__ = ("text", "segments", "nested")
+
+    def __init__(self, text, segments, nested=None):
+        self.text = text
+        self.segments = segments
+        self.nested = nested
+
+    def __repr__(self):
+        return f"Expression({self.text!r})"
+
+
+class Plan:
+    """A template split into literal text and parsed expressions.
+
+    `literals` always has one more item than `expressions`, and the output is
+    literals[0] + expressions[0] + literals[1] + ... once each expression is solved.
+    `unique` holds every distinct expression once, in order of first appearance.
+    `paths` caches the result of required_paths().
+    """
+
+    __slots__ = ("template", "brackets", "literals", "expressions", "unique", "paths")
+
+    def __init__(self, template, brackets, literals, expressions):
+        self.template = template
+        self.brackets = brackets
+        self.literals = literals
+        self.expressions = expressions
+        self.unique = tuple({e.text: e for e in expressions}.values())
+        self.paths = None
+
+
+def parse_expression(text):
+    """Parse the contents of a sigil into key path segments and arguments.
+
+    The first whitespace-separated token is the key path; any further tokens
+    are arguments, themselves key paths (or %literals), passed to the function
+    found at the end of the path: `user.greet user.name`.
+    """
+    path, *args = text.split() or ['']
+    keys = path.split('.')
+    segments = []
+    for i, key in enumerate(keys):
+        literal = key.startswith('%')
+        if literal:
+            key = key[1:]
+        last = i == len(keys) - 1
+        segments.append(Segment(key, tuple(parse_expression(a) for a in args) if last else (), literal))
+    return Expression(text, tuple(segments))
+
+
+def expression_for(text):
+    """Return the cached parsed expression for a piece of text."""
+    return expressions.get_or_create(text, lambda: parse_expression(text))
+
+
+# Tokens found by scan(), in order of precedence at the same position
+_LINE, _RIGHT, _LEFT = 0, 1, 2
+
+
+class _Frame:
+    """A sigil being scanned: where it opened and what it holds so far."""
+
+    __slots__ = ("start", "parts", "literals", "expressions")
+
+    def __init__(self, start):
+        self.start = start
+        self.parts = []
+        self.literals = []
+        self.expressions = []
+
+    def add(self, expression):
+        self.literals.append(''.join(self.parts))
+        self.parts = []
+        self.expressions.append(expression)
+
+    def absorb(self, child, left):
+        """Take back the contents of an unterminated child sigil as plain text."""
+        self.parts.append(left)
+        for literal, expression in zip(child.literals, child.expressions):
+            self.parts.append(literal)
+            self.add(expression)
+        self.parts.extend(child.parts)
+
+
+def scan(template, brackets):
+    """Split a template into literals and expressions in one pass.
+
+    Returns a tuple (literals, expressions, unfinished) where unfinished is the
+    position of the outermost sigil still open at the end of the template, or
+    None. Sigils may contain other sigils but never span lines; a left bracket
+    that is not closed on its line is plain text, and so is one written right
+    after a backslash (the backslash is dropped).
+    """
+    left, right = brackets
+    nests = left != right
+    size = len(left)
+    parsed = {}
+    stack = [_Frame(0)]
+    pos, end = 0, len(template)
+    find = template.find
+    # Next position of each token at or after pos, only searched again once passed
+    next_left = find(left)
+    next_right = next_line = -1
+    unfinished = None
+    while True:
+        frame = stack[-1]
+        if next_left != -1 and next_left < pos:
+            next_left = find(left, pos)
+        if len(stack) == 1:
+            # Fast path for the common case: sigils with no sigils inside, on one line
+            literals, found = frame.literals, frame.expressions
+            while next_left != -1:
+                at = next_left
+                start = at + size
+                close = find(right, start)
+                if (close == -1 or (at > pos and template[at - 1] == ESCAPE)
+                        or find('\n', start, close) != -1
+                        or (nests and find(left, start, close) != -1)):
+                    break
+                text = template[start:close]
+                expression = parsed.get(text)
+                if expression is None:
+                    expression = parsed[text] = parse_expression(text)
+                if frame.parts:
+                    frame.parts.append(template[pos:at])
+                    literals.append(''.join(frame.parts))
+                    frame.parts = []
+                else:
+                    literals.append(template[pos:at])
+                found.append(expression)
+                pos = close + len(right)
+                next_left = find(left, pos)
+            if next_left == -1:
+                frame.parts.append(template[pos:end])
+                break
+            at, token = next_left, _LEFT
+        else:
+            if next_right < pos:
+                next_right = find(right, pos)
+            if next_line < pos:
+                next_line = find('\n', pos)
+            found = [(p, t) for p, t in ((next_line, _LINE), (next_right, _RIGHT), (next_left, _LEFT))
+                     if p != -1 and (nests or t != _LEFT)]
+            if not found:
+                # Unterminated at the end of the template: every open sigil is plain text
+                unfinished = stack[1].start
+                while len(stack) > 1:
+                    child = stack.pop()
+                    stack[-1].absorb(child, left)
+                stack[0].parts.append(template[pos:end])
+                break
+            at, token = min(found)
+        if token == _LINE:
+            # Sigils never span lines: every open one becomes plain text
+            frame.parts.append(template[pos:at])
+            while len(stack) > 1:
+                child = stack.pop()
+                stack[-1].absorb(child, left)
+            pos = at
+        elif token == _RIGHT:
+            frame.parts.append(template[pos:at])
+            stack.pop()
+            text = template[frame.start + len(left):at]
+            if frame.expressions:
+                frame.literals.append(''.join(frame.parts))
+                nested = Plan(text, brackets, tuple(frame.literals), tuple(frame.expressions))
+                expression = Expression(text, None, nested)
+            else:
+                expression = parse_expression(''.join(frame.parts))
+                if expression.text != text:
+                    # Keep the text as written, escapes included
+                    expression = Expression(text, expression.segments)
+            stack[-1].add(expression)
+            pos = at + len(right)
+        elif at > pos and template[at - 1] == ESCAPE:
+            frame.parts.append(template[pos:at - 1])
+            frame.parts.append(left)
+            pos = at + len(left)
+        else:
+            frame.parts.append(template[pos:at])
+            stack.append(_Frame(at))
+            pos = at + len(left)
+    top = stack[0]
+    top.literals.append(''.join(top.parts))
+    return tuple(top.literals), tuple(top.expressions), unfinished
+
+
+def _expression_paths(expression, left):
+    """Yield the key paths an expression reads, then those of its arguments."""
+    if expression.nested is not None:
+        text = expression.text
+        head = text[:text.index(left)]
+        if head and not head[-1].isspace():
+            # The inner sigil completes a key: only the whole keys before it are known
+            head = head.rpartition('.')[0]
+        if head.strip():
+            yield from _expression_paths(parse_expression(head), left)
+        yield from required_paths(expression.nested)
+        return
+    path = []
+    for segment in expression.segments:
+        if segment.literal or not segment.key:
+            break
+        path.append(segment.key)
+    if path:
+        yield tuple(path)
+    for arg in expression.segments[-1].args:
+        yield from _expression_paths(arg, left)
+
+
+def required_paths(plan):
+    """Return the distinct key paths a plan can read, as tuples of keys, without solving it.
+
+    A function call is the path up to the function, followed by the paths of its
+    arguments. Paths may end with tool names, as tools and keys look the same.
+    For nested sigils the keys before the inner sigil and the paths of the inner
+    sigils are listed. Sigils found in solved values are not known in advance.
+    """
+    if plan.paths is None:
+        left = plan.brackets[0]
+        plan.paths = tuple(dict.fromkeys(
+            path for expression in plan.unique for path in _expression_paths(expression, left)))
+    return plan.paths
+
+
+def parse(template, brackets):
+    """Parse a template into a Plan without consulting the cache."""
+    brackets = tuple(brackets)
+    literals, expressions, _ = scan(template, brackets)
+    return Plan(template, brackets, literals, expressions)
+
+
+def compile_template(template, brackets=("%[", "]")):
+    """Return the cached Plan for a template, parsing it on first use."""
+    brackets = tuple(brackets)
+    return plans.get_or_create((template, brackets), lambda: parse(template, brackets))
+
+
+__all__ = ["Segment", "Expression", "Plan", "parse", "scan", "compile_template", "expression_for",
+           "required_paths", "plans", "expressions", "ESCAPE"]
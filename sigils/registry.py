@@ -0,0 +1,246 @@
+import os
+import ast
+import sys
+import json
+import hashlib
+import threading
+import importlib
+import importlib.util
+
+# Entry point group scanned for tool providers
+ENTRY_POINT_GROUP = "sigils.tools"
+
+# Environment variable with directories of tool modules, separated by os.pathsep
+PATH_VARIABLE = "SIGILS_TOOLS_PATH"
+
+INDEX_VERSION = 1
+
+
+class Provider:
+    """A module (or single function) that supplies tools, imported on first use."""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._target = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._loader()
+        return self._target
+
+    def __repr__(self):
+        return f"Provider({self.name!r})"
+
+
+class LazyTool:
+    """Placeholder kept in the tools table until the tool is first referenced."""
+
+    __slots__ = ("name", "provider", "attr")
+
+    def __init__(self, name, provider, attr=None):
+        self.name = name
+        self.provider = provider
+        self.attr = attr
+
+    def load(self, tools):
+        """Import the provider, replace this placeholder with the real tool and return it.
+
+        Returns None (and drops the placeholder) if the provider does not
+        actually define the tool.
+        """
+        target = self.provider.load()
+        tool = getattr(target, self.attr, None) if self.attr else target
+        if tool is None:
+            if tools.get(self.name) is self:
+                del tools[self.name]
+            return None
+        if tools.get(self.name) is self:
+            tools[self.name] = tool
+        return tool
+
+    def __repr__(self):
+        return f"LazyTool({self.name!r}, {self.provider!r})"
+
+
+def scan_names(path):
+    """List the tools a module source file defines, without importing it.
+
+    Uses a literal __all__ if there is one, otherwise every public top-level function.
+    """
+    with open(path, 'rb') as file:
+        tree = ast.parse(file.read(), filename=path)
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                isinstance(t, ast.Name) and t.id == '__all__' for t in node.targets):
+            try:
+                return [str(name) for name in ast.literal_eval(node.value)]
+            except ValueError:
+                pass
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and not node.name.startswith('_'):
+            names.append(node.name)
+    return names
+
+
+def index_path():
+    """Where discover() keeps the tool names of provider sources between processes."""
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sigils', 'tool-names.json')
+
+
+class NameIndex:
+    """Tool names of provider source files, keyed by their size and modification time.
+
+    Saved as JSON so that processes starting later only parse changed sources.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or index_path()
+        self.changed = False
+        self.entries = None
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as file:
+                data = json.load(file)
+            self.entries = data["sources"] if data.get("version") == INDEX_VERSION else {}
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+
+    def names(self, source):
+        """Return the tool names of a source file, parsing it only if it changed."""
+        if self.entries is None:
+            self._load()
+        stat = os.stat(source)
+        key = [stat.st_mtime_ns, stat.st_size]
+        entry = self.entries.get(source)
+        if entry is None or entry[0] != key:
+            entry = self.entries[source] = [key, scan_names(source)]
+            self.changed = True
+        return entry[1]
+
+    def save(self):
+        if not self.changed:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".tmp", 'w') as file:
+                json.dump({"version": INDEX_VERSION, "sources": self.entries}, file)
+            os.replace(self.path + ".tmp", self.path)
+            self.changed = False
+        except OSError:
+            pass  # Without a writable cache the sources are parsed again next time
+
+
+def _module_source(module_name):
+    """Find the .py source of a module, on sys.path without importing its packages.
+
+    Modules served by meta path finders (such as editable installs) are looked
+    up with importlib.util.find_spec, which imports their parent packages.
+    """
+    parts = module_name.split('.')
+    for entry in sys.path:
+        base = os.path.join(entry or os.curdir, *parts)
+        for path in (base + '.py', os.path.join(base, '__init__.py')):
+            if os.path.isfile(path):
+                return path
+    try:
+        spec = importlib.util.find_spec(module_name)
+    except Exception:
+        return None  # A parent package failing to import; its tools are skipped
+    origin = spec.origin if spec is not None else None
+    if origin and origin.endswith('.py') and os.path.isfile(origin):
+        return origin
+    return None
+
+
+def _import_file(path):
+    digest = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]
+    module_name = f"_sigils_tools_{os.path.splitext(os.path.basename(path))[0]}_{digest}"
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def add_directory(tools, directory, index=None):
+    """Index every .py module in a directory as a tool provider.
+
+    With a NameIndex, unchanged modules are not parsed again.
+    """
+    names_of = index.names if index is not None else scan_names
+    added = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.py') or filename.startswith('_'):
+            continue
+        path = os.path.join(directory, filename)
+        provider = Provider(path, lambda path=path: _import_file(path))
+        for name in names_of(path):
+            if name not in tools:
+                tools[name] = LazyTool(name, provider, name)
+                added.append(name)
+    return added
+
+
+def _entry_points(group):
+    from importlib import metadata
+    eps = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        return eps.select(group=group)
+    return eps.get(group, [])  # Python 3.9
+
+
+def add_entry_points(tools, entry_points=None, index=None):
+    """Index tool providers declared as entry points.
+
+    An entry point naming a function (`slug = pkg.text:slug`) adds one tool. One
+    naming a module (`text = pkg.text`) adds every tool found in its source,
+    which is located on sys.path without importing the package.
+    """
+    if entry_points is None:
+        entry_points = _entry_points(ENTRY_POINT_GROUP)
+    names_of = index.names if index is not None else scan_names
+    added = []
+    for ep in entry_points:
+        module_name, _, attr = ep.value.partition(':')
+        module_name, attr = module_name.strip(), attr.strip()
+        if attr:
+            provider = Provider(ep.value, lambda module_name=module_name: importlib.import_module(module_name))
+            names = [(ep.name, attr)]
+        else:
+            source = _module_source(module_name)
+            if source is None:
+                continue
+            provider = Provider(module_name, lambda module_name=module_name: importlib.import_module(module_name))
+            names = [(name, name) for name in names_of(source)]
+        for name, attr in names:
+            if name not in tools:
+                tools[name] = LazyTool(name, provider, attr)
+                added.append(name)
+    return added
+
+
+def discover(tools):
+    """Index providers from entry points and from the directories in SIGILS_TOOLS_PATH.
+
+    Tool names found in provider sources are kept in a NameIndex, so each
+    source is only parsed again after it changes.
+    """
+    index = NameIndex()
+    try:
+        add_entry_points(tools, index=index)
+    except Exception:
+        pass  # Broken package metadata should never prevent using the builtins
+    for directory in os.environ.get(PATH_VARIABLE, '').split(os.pathsep):
+        if directory and os.path.isdir(directory):
+            add_directory(tools, directory, index)
+    index.save()
+
+
+__all__ = ["Provider", "LazyTool", "NameIndex", "scan_names", "add_directory", "add_entry_points",
+           "discover", "index_path", "ENTRY_POINT_GROUP", "PATH_VARIABLE"]
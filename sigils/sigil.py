@@ -1,150 +1,792 @@
-import re
+import io
+import time
+import asyncio
+import inspect
+import functools
 import threading
+import contextvars
 
-from .tools import tools
-from .context import Context
+from .tools import tools, call_tool, find_tool, results as tool_results
+from .context import Context, casefold_key, indexes
+from .parser import compile_template, parse, plans, expression_for, required_paths
+from .binding import binding_for
+from .registry import LazyTool
+from .metrics import Trace, recorder, hit_rate
+from .compiler import compile_plan
 
+_SCALARS = (str, bytes, int, float, bool)
 
-class Sigil:
-    _cache = threading.local()
+# Lookups kept for reuse across the contexts of a batch render before starting over
+MAX_SHARED = 4096
+
+# Marks threads that are solving sigils on behalf of an executor
+_worker = threading.local()
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "MISSING"
+
+
+# Returned by __sigil_resolve__ when a context object has no value for a path
+MISSING = _Missing()
+
+# Protocol methods of the context classes seen so far, False for classes without
+# one: looking up a missing attribute on a class is slow compared to a dict.
+_resolvers = {}
+_prefetchers = {}
+
+
+def _hook(hooks, cls, name):
+    """Look up and remember the protocol method `name` of a context class."""
+    hook = getattr(cls, name, None) or False
+    if len(hooks) >= 1024:
+        hooks.clear()
+    hooks[cls] = hook
+    return hook
+
+
+class _InFlight:
+    """Sigils being solved by the branches of a concurrent render.
+
+    The first branch to reach a sigil solves it; the others wait for its value
+    in the memo, unless waiting would close a cycle of branches each waiting
+    on the other, which is a reference cycle (left unexpanded, as usual).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.owners = {}
+        self.events = {}
+        self.waits = {}
 
+    def acquire(self, match, branch):
+        """Return True if the branch should solve match, False once another branch
+        has, or None if waiting for it would close a cycle."""
+        with self.lock:
+            owner = self.owners.get(match)
+            if owner is None or owner is branch:
+                self.owners[match] = branch
+                self.events[match] = threading.Event()
+                return True
+            current, seen = owner, set()
+            while current is not None and id(current) not in seen:
+                if current is branch:
+                    return None
+                seen.add(id(current))
+                waiting = self.waits.get(id(current))
+                current = self.owners.get(waiting) if waiting is not None else None
+            event = self.events[match]
+            self.waits[id(branch)] = match
+        event.wait()
+        with self.lock:
+            del self.waits[id(branch)]
+        return False
+
+    def release(self, match):
+        with self.lock:
+            self.events[match].set()
+
+
+class _Render:
+    """State for a single render of a template against one context.
+
+    `memo` maps expression text to its solved value, so a sigil that appears many
+    times (or at many nesting depths) is resolved only once. `active` holds the
+    expressions currently being expanded, to detect reference cycles. `shared`
+    is an optional lookup cache reused across the contexts of a batch render.
+    `trace` collects timings when the Sigil is instrumented. `inflight` is
+    shared by the branches of a concurrent render.
+    """
+
+    __slots__ = ("context", "memo", "active", "shared", "tasks", "waits", "trace", "inflight")
+
+    def __init__(self, context, shared=None):
+        self.context = context
+        self.memo = {}
+        self.active = set()
+        self.shared = shared
+        # Only used by async renders
+        self.tasks = None
+        self.waits = None
+        self.trace = None
+        self.inflight = None
+
+
+class Sigil:
     # Default settings at the class level
-    
-    # TODO: Allow left and right brackets to be configurable
     brackets = ["%[", "]"]
 
     executable = True
     max_depth = 6
     debug = False
     on_error = "raise"
+    executor = None
+    on_render = None
+    compiled = False
 
     def __init__(self, template, *,
-        executable=None, brackets=None, max_depth=None, debug=None, on_error=None):
+        executable=None, brackets=None, max_depth=None, debug=None, on_error=None, cache=True,
+        executor=None, on_render=None, compiled=None):
         """
         Initialize a new Sigil instance.
 
         Args:
             template (str): The template string.
             executable (bool, optional): Whether to executable callable values.
+            brackets (list, optional): Left and right brackets that delimit sigils.
             max_depth (int, optional): Maximum depth for resolving sigils.
-            debug (bool, optional): Enable debug logging.
+            debug (bool, optional): Time each render, sigil and function call
+                (see Sigil.stats()).
+            cache (bool, optional): Keep the parsed template in the shared cache.
+                Disable for large one-off templates such as whole files.
+            executor (Executor, optional): Pool used to solve independent sigils
+                concurrently, e.g. a ThreadPoolExecutor for blocking callables.
+            on_render (callable, optional): Called with the timings of each
+                render as a dict. Enables the same instrumentation as debug.
+            compiled (bool, optional): Generate a render function specialized for
+                the shape of the first context solved (see Sigil.compile()).
         """
         self.template = template
 
         # Use instance-specific values or fall back to class defaults
-        self.executable = executable if brackets is not None else self.__class__.executable
-        self.brackets = brackets if executable is not None else self.__class__.brackets
+        self.executable = executable if executable is not None else self.__class__.executable
+        self.brackets = brackets if brackets is not None else self.__class__.brackets
         self.max_depth = max_depth if max_depth is not None else self.__class__.max_depth
         self.debug = debug if debug is not None else self.__class__.debug
         self.on_error = on_error if on_error is not None else self.__class__.on_error
+        self.executor = executor if executor is not None else self.__class__.executor
+        self.on_render = on_render if on_render is not None else self.__class__.on_render
+        self.compiled = compiled if compiled is not None else self.__class__.compiled
+
+        # Parsed once per process and shared by every Sigil with the same template
+        if cache:
+            self.plan = compile_template(template, self.brackets)
+        else:
+            self.plan = parse(template, tuple(self.brackets))
+
+        self.function = None
+        if self.debug or self.on_render is not None:
+            self._instrument()
+        elif self.compiled:
+            self.solve = self._compiled_solve
 
-        self.pattern = getattr(self._cache, 'value', {}).get(template)
-        if self.pattern is None:
-            # TODO: Use self.brackets, but first sanitize it for re compatibility
-            self.pattern = re.compile(r'%\[(.*?)\]')
-            self._cache.value = {template: self.pattern}
+    @staticmethod
+    def cache_stats():
+        """Return hit, miss and eviction counters for the compiled template cache."""
+        return plans.stats()
+
+    @staticmethod
+    def stats(reset=False):
+        """Return a snapshot of the timings of instrumented renders and the cache counters.
+
+        Times are in seconds; a sigil's time includes the sigils nested in its
+        value. Pass reset=True to start counting again after the snapshot.
+        """
+        snapshot = recorder.snapshot()
+        if reset:
+            recorder.reset()
+        snapshot["memo"]["hit_rate"] = hit_rate(snapshot["memo"])
+        snapshot["caches"] = {
+            "templates": plans.stats(),
+            "tool_results": tool_results.stats(),
+            "key_index": indexes.stats(),
+        }
+        for stats in snapshot["caches"].values():
+            stats["hit_rate"] = hit_rate(stats)
+        return snapshot
+
+    def compile(self, context):
+        """Generate a render function specialized for the shape of a context and use it.
+
+        Key paths that resolve through dicts, lists and chained pure tools become
+        direct lookups, and the output is assembled with a single f-string.
+        Every step is guarded by the type it had in this context; when a later
+        context differs the generic resolver solves it instead. Sigils that call
+        functions, use the global context or expand to nested sigils are always
+        solved by the resolver. Returns the generated source.
+        """
+        self.function, source = compile_plan(
+            self.plan, context, functools.partial(Sigil.solve, self), self._solve_some)
+        self.solve = self._compiled_solve
+        return source
+
+    def _compiled_solve(self, context):
+        if context is None:
+            return Sigil.solve(self, context)
+        if self.function is None:
+            self.compile(context)
+        return self.function(context)
+
+    def _solve_some(self, context, expressions):
+        """Solve some expressions of the plan, returning the text each one is replaced by."""
+        plan = self.plan
+        render = _Render(context)
+        self._prefetch(context)
+        return {e.text: self._format(self._solve_expression(e, plan, render, 0), e.text, plan.brackets)
+                for e in expressions}
+
+    def sigils(self):
+        """Return the distinct sigils in the template, in order of appearance."""
+        return [expression.text for expression in self.plan.unique]
+
+    def required_paths(self):
+        """Return every key path the template can read, as tuples of keys, without solving it.
+
+        Function calls list the path to the function followed by the paths of
+        its arguments, e.g. %[user.greet user.name] gives ("user", "greet") and
+        ("user", "name"). Paths may end with a tool name (%[user.name.upper]).
+        These are the paths passed to context objects that define
+        __sigil_prefetch__(self, paths), which is called before each render so
+        that backends can load everything in one query.
+        """
+        return list(required_paths(self.plan))
+
+    def _prefetch(self, context):
+        """Hand the paths of the template to a context that implements __sigil_prefetch__."""
+        prefetch = _prefetchers.get(type(context))
+        if prefetch is None:
+            prefetch = _hook(_prefetchers, type(context), '__sigil_prefetch__')
+        if prefetch is not False:
+            return prefetch(context, required_paths(self.plan))
 
     def solve(self, context):
         """Solve the template with the provided context."""
         if context is None:
-            context = Context.current_context
+            context = Context.current()
         solved = self._solve(context, 0)
-        parts = self.pattern.split(self.template)
-        for i in range(1, len(parts), 2):
-            value = solved.get(parts[i])
-            if isinstance(value, dict):
-                if "value" in value:
-                    parts[i] = value["value"]
-                else:
-                    parts[i] = "|".join(value.keys())
-            else:
-                parts[i] = str(value) if value is not None else f'%[{parts[i]}]'
-        result = ''.join(parts)
-        return result
+        return self._assemble(self.plan, solved)
+
+    @staticmethod
+    def _assemble(plan, solved):
+        """Join the literal parts of a plan with the solved value of each expression."""
+        literals = plan.literals
+        parts = [literals[0]]
+        for i, expression in enumerate(plan.expressions, 1):
+            parts.append(Sigil._format(solved.get(expression.text), expression.text, plan.brackets))
+            parts.append(literals[i])
+        return ''.join(parts)
 
-    def _run_function(self, func, func_args, value, context):
-        num_args = func.__code__.co_argcount
+    @staticmethod
+    def _format(value, match, brackets):
+        """Convert the solved value of one expression to the text that replaces it."""
+        if isinstance(value, dict):
+            if "value" in value:
+                return value["value"]
+            return "|".join(value.keys())
+        if value is None:
+            left, right = brackets
+            return f'{left}{match}{right}'
+        return str(value)
+
+    def stream(self, context):
+        """Solve the template lazily, yielding each chunk of output as soon as it is ready.
+
+        Literal text and solved sigils are yielded one by one, so the full output
+        is never held in memory at once.
+        """
+        plan = self.plan
+        render = _Render(context if context is not None else {})
+        self._prefetch(render.context)
+        literals = plan.literals
+        if literals[0]:
+            yield literals[0]
+        for i, expression in enumerate(plan.expressions, 1):
+            value = self._solve_expression(expression, plan, render, 0)
+            yield self._format(value, expression.text, plan.brackets)
+            if literals[i]:
+                yield literals[i]
+
+    def solve_into(self, fileobj, context=None, *, encoding="utf-8"):
+        """Solve the template directly into a text or binary file object.
+
+        Returns the number of characters (text) or bytes (binary) written.
+        """
+        binary = isinstance(fileobj, (io.RawIOBase, io.BufferedIOBase)) or (
+            not isinstance(fileobj, io.TextIOBase) and 'b' in getattr(fileobj, 'mode', ''))
+        written = 0
+        for chunk in self.stream(context):
+            if binary:
+                chunk = chunk.encode(encoding)
+            fileobj.write(chunk)
+            written += len(chunk)
+        return written
+
+    def solve_traced(self, context):
+        """Solve the template and also report every sigil that was solved.
+
+        Returns a tuple (result, values) where values maps the text of each sigil,
+        including those found inside nested values, to the text it solved to.
+        """
+        render = _Render(context if context is not None else {})
+        self._prefetch(render.context)
+        solved = self._solve_plan(self.plan, render, 0)
+        brackets = self.plan.brackets
+        values = {match: self._format(value, match, brackets) for match, value in render.memo.items()}
+        return self._assemble(self.plan, solved), values
+
+    def _run_function(self, func, func_args, value, render, chained=False):
+        """Call a function found on a key path, binding its sigil arguments."""
+        args = ()
         if func_args:
-            solved_args = [Sigil(f'%[{arg}]').solve(context) for arg in func_args]
-            if num_args > 0:
-                if solved_args and '%[' not in solved_args[0]:
-                    return func(solved_args[0], *solved_args[1:num_args - 1])
-                else:
-                    return func(func_args[0], *func_args[1:num_args - 1])
+            args = tuple(self._solve_argument(arg, render) for arg in func_args)
+        return call_tool(func, binding_for(func).arguments(value, args, chained))
+
+    def _solve_argument(self, arg, render):
+        """Solve a function argument to a string, like the same sigil anywhere else in the template."""
+        plan = self.plan
+        return self._format(self._solve_expression(arg, plan, render, 0), arg.text, plan.brackets)
+
+    def _step(self, value, segment, render):
+        """Resolve one segment of a key path against value.
+
+        Returns a tuple (result, called); result is None if the segment does not
+        resolve, and called tells whether a function was run to produce it.
+        """
+        key = segment.key
+        func_args = segment.args
+        literal = segment.literal
+        called = False
+        if literal:
+            temp = key
+        elif value and isinstance(value, dict) and key in value:
+            temp = value.get(key, None)
+            if callable(temp):
+                temp = self._run_function(temp, func_args, value, render)
+                called = True
+        elif value and isinstance(value, list) and key.lstrip("+-").isdigit():
+            temp = value[int(key)]
+        elif key in tools or find_tool(key):
+            tool_func = tools[key]
+            if type(tool_func) is LazyTool:
+                tool_func = tool_func.load(tools)
+            if callable(tool_func):
+                temp = self._run_function(
+                    tool_func, func_args, value, render, chained=value is not render.context)
+                called = True
             else:
-                return func()
+                temp = tool_func
         else:
-            if num_args == 1:
-                return func(value)
+            temp = None
+        if temp and callable(temp):
+            temp = temp()
+            called = True
+        if temp is None and '-' in key and not literal:
+            temp = value.get(key.replace('-', '_')) if isinstance(value, dict) else None
+        if temp is None and hasattr(value, key) and not literal:
+            temp = getattr(value, key)
+        if temp is None and '-' in key and hasattr(value, key.replace('-', '_')) and not literal:
+            temp = getattr(value, key.replace('-', '_'))
+        if temp is None and value and isinstance(value, dict) and not literal:
+            actual = casefold_key(value, key.replace('-', '_'))
+            if actual is None and '-' in key:
+                actual = casefold_key(value, key)
+            if actual is not None:
+                temp = value[actual]
+                if callable(temp):
+                    temp = self._run_function(temp, func_args, value, render)
+                    called = True
+        return temp, called
+
+    def _resolve_object(self, resolver, value, segments, i, render):
+        """Resolve the keys from segments[i] on with a __sigil_resolve__ call on value.
+
+        The path passed ends before the first literal, or with the first segment
+        that has arguments; a callable found there is called with them. While
+        the path is missing and ends with a tool name (%[config.name.upper]),
+        it is asked again without it, and the tools left out are applied to the
+        result. Returns a tuple (result, next segment, called).
+        """
+        end = i
+        while end < len(segments) and not segments[end].literal:
+            end += 1
+            if segments[end - 1].args:
+                break
+        full = end
+        result = MISSING
+        while end > i:
+            result = resolver(value, tuple(segment.key for segment in segments[i:end]))
+            if result is not MISSING or not find_tool(segments[end - 1].key):
+                break
+            end -= 1
+        if result is MISSING:
+            if end == i:
+                # Only tools: apply them to the object itself
+                result, called = self._step(value, segments[i], render)
+                return result, i + 1, called
+            return None, full, False
+        if callable(result):
+            func_args = segments[end - 1].args
+            if func_args:
+                result = self._run_function(result, func_args, value, render)
             else:
-                return func()
+                result = result()
+            return result, end, True
+        return result, end, False
 
-    def _solve(self, context, depth=0):
-        solved = {}
-        for match in self.pattern.findall(self.template):
-            original = str(match)
-            keys = match.split('.')
-            value = context
-            func_args = []
-            for i, key in enumerate(keys):
-                if ' ' in key:
-                    key_parts = key.split(' ')
-                    key = key_parts[0]
-                    func_args = key_parts[1:]
-                literal = False
-                if key.startswith('%'):
-                    key = key[1:]
-                    literal = True
-                if literal:
-                    temp = key
-                elif value and isinstance(value, dict) and key in value:
-                    temp = value.get(key, None)
-                    if callable(temp):
-                        temp = self._run_function(temp, func_args, value, context)
-                elif value and isinstance(value, list) and key.lstrip("+-").isdigit():
-                    temp = value[int(key)]
-                elif key in tools:
-                    tool_func = tools[key]
-                    if callable(tool_func):
-                        temp = self._run_function(tool_func, func_args, value, context)
-                    else:
-                        temp = tool_func
-                else:
-                    temp = None
-                if temp and callable(temp):
-                    temp = temp()
-                if temp is None and '-' in key and not literal:
-                    temp = value.get(key.replace('-', '_')) if isinstance(value, dict) else None
-                if temp is None and hasattr(value, key) and not literal:
-                    temp = getattr(value, key)
-                if temp is None and '-' in key and hasattr(value, key.replace('-', '_')) and not literal:
-                    temp = getattr(value, key.replace('-', '_'))
-                if temp is not None:
-                    value = temp
-                else:
-                    value = original
+    def _expand(self, expression, render):
+        """Solve the sigils inside a nested expression and parse the text they produce."""
+        nested = expression.nested
+        render.active.add(expression.text)
+        try:
+            solved = self._solve_plan(nested, render, 0)
+        finally:
+            render.active.discard(expression.text)
+        return expression_for(self._assemble(nested, solved))
+
+    def _resolve(self, expression, render):
+        """Walk the key path of one expression. Returns None if it does not resolve."""
+        if expression.nested is not None:
+            expression = self._expand(expression, render)
+        shared = render.shared
+        # Objects visited since the last function call: the rest of the path from
+        # any of them is a plain lookup, so batch renders may reuse the result.
+        pending = []
+        value = render.context
+        segments = expression.segments
+        i = 0
+        while i < len(segments):
+            # Each context of a batch is a distinct object: only what it leads to is shared
+            if shared is not None and i and not isinstance(value, _SCALARS):
+                entry = shared.get((id(value), expression.text, i))
+                if entry is not None and entry[0] is value:
+                    value = entry[1]
                     break
-            if value is not None:
-                solved[match] = value
+                pending.append((i, value))
+            resolver = _resolvers.get(type(value))
+            if resolver is None:
+                resolver = _hook(_resolvers, type(value), '__sigil_resolve__')
+            if resolver is False:
+                value, called = self._step(value, segments[i], render)
+                i += 1
             else:
-                global_context = getattr(Context._context, 'value', {})
-                value = global_context.get(match.replace('-', '_'), None)
-                if value is not None:
-                    solved[match] = value
-        if depth < self.max_depth:
-            for key, value in list(solved.items()):
-                if isinstance(value, str) and '%' in value:
-                    s = Sigil(value)
-                    solved_value = s._solve(context, depth + 1)
-                    if solved_value:
-                        solved[key] = {
-                            'value': s.solve(context),
-                            'sub_values': solved_value
-                        }
-                    else:
-                        solved[key] = {'value': value}
+                value, i, called = self._resolve_object(resolver, value, segments, i, render)
+            if called:
+                pending.clear()
+            if value is None:
+                break
+        if shared is not None:
+            for i, obj in pending:
+                shared[(id(obj), expression.text, i)] = (obj, value)
+        return value
+
+    def _solve(self, context, depth=0, render=None):
+        if render is None:
+            render = _Render(context)
+        self._prefetch(context)
+        if self.executor is not None and len(self.plan.unique) > 1:
+            return self._solve_concurrently([(e, self.plan) for e in self.plan.unique], render)
+        return self._solve_plan(self.plan, render, depth)
+
+    def _solve_concurrently(self, items, render):
+        """Solve (expression, plan) pairs on the executor and wait for all of them.
+
+        Each task keeps its own cycle tracking but shares the render memo, and
+        waits for sigils another task is already solving. Solves started from
+        inside one of these tasks run inline, so a saturated pool can never wait
+        on itself.
+        """
+        if getattr(_worker, 'active', False):
+            return {e.text: self._solve_expression(e, plan, render, 0) for e, plan in items}
+
+        inflight = _InFlight()
+
+        def solve_one(expression, plan):
+            branch = _Render(render.context, render.shared)
+            branch.memo = render.memo
+            branch.trace = render.trace
+            branch.inflight = inflight
+            _worker.active = True
+            try:
+                return self._solve_expression(expression, plan, branch, 0)
+            finally:
+                _worker.active = False
+
+        # Run each task in a copy of this context so the global Context follows it
+        futures = [self.executor.submit(contextvars.copy_context().run, solve_one, e, plan)
+                   for e, plan in items]
+        return {e.text: future.result() for (e, _), future in zip(items, futures)}
+
+    def _solve_plan(self, plan, render, depth):
+        """Solve every distinct expression in a plan, sharing the render state across nesting levels."""
+        solved = {}
+        for expression in plan.unique:
+            solved[expression.text] = self._solve_expression(expression, plan, render, depth)
         return solved
 
+    def _solve_expression(self, expression, plan, render, depth):
+        match = expression.text
+        memo = render.memo
+        if match in memo:
+            return memo[match]
+        if match in render.active:
+            # Reference cycle (a -> b -> a): leave the sigil unexpanded
+            left, right = plan.brackets
+            return f'{left}{match}{right}'
+        inflight = render.inflight
+        if inflight is not None:
+            owned = inflight.acquire(match, render)
+            if owned is None:
+                left, right = plan.brackets
+                return f'{left}{match}{right}'
+            if owned:
+                try:
+                    return self._compute_expression(expression, plan, render, depth)
+                finally:
+                    inflight.release(match)
+            if match in memo:
+                return memo[match]
+            # The branch that owned it failed: solve it here
+        return self._compute_expression(expression, plan, render, depth)
+
+    def _compute_expression(self, expression, plan, render, depth):
+        match = expression.text
+        value = self._resolve(expression, render)
+        if value is None:
+            value = self._global_value(match)
+        if isinstance(value, str) and depth < self.max_depth and plan.brackets[0] in value:
+            nested = compile_template(value, plan.brackets)
+            render.active.add(match)
+            try:
+                sub_values = self._solve_plan(nested, render, depth + 1)
+            finally:
+                render.active.discard(match)
+            if sub_values:
+                value = {
+                    'value': self._assemble(nested, sub_values),
+                    'sub_values': sub_values
+                }
+            else:
+                value = {'value': value}
+        render.memo[match] = value
+        return value
+
+    def _instrument(self):
+        """Route this instance through the timed variants of the render steps.
+
+        The methods are replaced on the instance only, so Sigils that are not
+        instrumented run exactly the same code as before.
+        """
+        self.solve = self._timed_solve
+        self._solve_expression = self._timed_solve_expression
+        self._run_function = self._timed_run_function
+        self._resolve = self._timed_resolve
+
+    def _timed_solve(self, context):
+        if context is None:
+            context = Context.current()
+        render = _Render(context)
+        trace = render.trace = Trace(self.template)
+        start = time.perf_counter()
+        try:
+            solved = self._solve(context, 0, render)
+            return self._assemble(self.plan, solved)
+        finally:
+            trace.elapsed = time.perf_counter() - start
+            recorder.record(trace)
+            if self.on_render is not None:
+                self.on_render(trace.as_dict())
+
+    def _timed_solve_expression(self, expression, plan, render, depth):
+        trace = render.trace
+        if trace is None:
+            return Sigil._solve_expression(self, expression, plan, render, depth)
+        match = expression.text
+        if match in render.memo:
+            trace.memo_hits += 1
+            return render.memo[match]
+        if depth > trace.depth:
+            trace.depth = depth
+        start = time.perf_counter()
+        value = Sigil._solve_expression(self, expression, plan, render, depth)
+        trace.sigils[match] = time.perf_counter() - start
+        return value
+
+    def _timed_run_function(self, func, func_args, value, render, chained=False):
+        trace = render.trace
+        if trace is None:
+            return Sigil._run_function(self, func, func_args, value, render, chained)
+        start = time.perf_counter()
+        try:
+            return Sigil._run_function(self, func, func_args, value, render, chained)
+        finally:
+            elapsed = time.perf_counter() - start
+            name = getattr(func, '__name__', None)
+            if name is not None and tools.get(name) is func:
+                trace.calls.append(("tool", name, elapsed))
+            else:
+                trace.calls.append(("callable", self._callable_name(func), elapsed))
+
+    @staticmethod
+    def _callable_name(func):
+        """A name that tells context callables apart, lambdas included."""
+        target = getattr(func, '__func__', func)
+        name = getattr(target, '__qualname__', None) or type(target).__qualname__
+        module = getattr(target, '__module__', None)
+        if module:
+            name = f"{module}.{name}"
+        code = getattr(target, '__code__', None)
+        if code is not None and '<lambda>' in name:
+            name = f"{name}:{code.co_firstlineno}"
+        return name
+
+    def _timed_resolve(self, expression, render):
+        value = Sigil._resolve(self, expression, render)
+        if value is None and render.trace is not None:
+            match = expression.text
+            if Context.lookup(match.replace('-', '_')) is None:
+                render.trace.unresolved.append(match)
+        return value
+
+    @staticmethod
+    def _global_value(match):
+        """Look up an unresolved sigil in the global context, or return its text."""
+        return Context.lookup(match.replace('-', '_'), match)
+
+    async def asolve(self, context, timeout=None):
+        """Solve the template asynchronously, awaiting any awaitable values.
+
+        Independent sigils are resolved concurrently, so a template with several
+        slow async lookups takes about as long as the slowest one. Sigils nested
+        inside a value are solved once that value is available. If timeout (in
+        seconds) expires, pending lookups are cancelled and asyncio.TimeoutError
+        is raised.
+        """
+        render = _Render(context if context is not None else {})
+        render.tasks = {}
+        render.waits = {}
+        prefetched = self._prefetch(render.context)
+        if inspect.isawaitable(prefetched):
+            await prefetched
+        coro = self._asolve_plan(self.plan, render, 0, ())
+        if timeout is not None:
+            solved = await asyncio.wait_for(coro, timeout)
+        else:
+            solved = await coro
+        return self._assemble(self.plan, solved)
+
+    async def _asolve_plan(self, plan, render, depth, chain):
+        expressions = plan.unique
+        values = await asyncio.gather(*(
+            self._asolve_expression(expression, plan, render, depth, chain)
+            for expression in expressions))
+        return {expression.text: value for expression, value in zip(expressions, values)}
+
+    async def _asolve_expression(self, expression, plan, render, depth, chain):
+        """Async counterpart of _solve_expression.
+
+        Concurrent requests for the same sigil share one task. `chain` holds the
+        sigils being expanded above this one, and render.waits records which
+        sigils each one is waiting on, so reference cycles are detected even
+        when they span concurrent branches.
+        """
+        match = expression.text
+        if match in render.memo:
+            return render.memo[match]
+        left, right = plan.brackets
+        if match in chain:
+            return f'{left}{match}{right}'
+        task = render.tasks.get(match)
+        if task is None:
+            task = asyncio.ensure_future(self._acompute(expression, plan, render, depth, chain))
+            render.tasks[match] = task
+        elif self._waits_on(render.waits, match, chain):
+            return f'{left}{match}{right}'
+        waiter = chain[-1] if chain else None
+        render.waits.setdefault(waiter, set()).add(match)
+        try:
+            return await task
+        finally:
+            render.waits[waiter].discard(match)
+
+    @staticmethod
+    def _waits_on(waits, match, chain):
+        """Tell whether match is (transitively) waiting on any sigil in chain."""
+        seen, stack = set(), [match]
+        while stack:
+            current = stack.pop()
+            if current in chain:
+                return True
+            if current not in seen:
+                seen.add(current)
+                stack.extend(waits.get(current, ()))
+        return False
+
+    async def _acompute(self, expression, plan, render, depth, chain):
+        match = expression.text
+        if expression.nested is not None:
+            nested = expression.nested
+            solved = await self._asolve_plan(nested, render, depth, chain + (match,))
+            expression = expression_for(self._assemble(nested, solved))
+        segments = expression.segments
+        args = [arg for segment in segments for arg in segment.args if arg.text not in render.memo]
+        if args:
+            # Await the arguments first, so that binding them finds each value in the memo
+            await asyncio.gather(*(
+                self._asolve_expression(arg, plan, render, depth, chain + (match,)) for arg in args))
+        value = render.context
+        i = 0
+        while i < len(segments):
+            resolver = _resolvers.get(type(value))
+            if resolver is None:
+                resolver = _hook(_resolvers, type(value), '__sigil_resolve__')
+            if resolver is False:
+                value, _ = self._step(value, segments[i], render)
+                i += 1
+            else:
+                value, i, _ = self._resolve_object(resolver, value, segments, i, render)
+            if inspect.isawaitable(value):
+                value = await value
+            if value is None:
+                break
+        if value is None:
+            value = self._global_value(match)
+        if isinstance(value, str) and depth < self.max_depth and plan.brackets[0] in value:
+            nested = compile_template(value, plan.brackets)
+            sub_values = await self._asolve_plan(nested, render, depth + 1, chain + (match,))
+            if sub_values:
+                value = {
+                    'value': self._assemble(nested, sub_values),
+                    'sub_values': sub_values
+                }
+            else:
+                value = {'value': value}
+        render.memo[match] = value
+        return value
+
+    def render_many(self, contexts):
+        """Solve the template against each context in an iterable, returning a list."""
+        return list(self.iter_render(contexts))
+
+    def iter_render(self, contexts):
+        """Lazily solve the template against each context in an iterable.
+
+        Key paths that pass through the same object in several contexts (for
+        example a shared tenant or settings dict) are resolved once for the whole
+        batch, as long as no function is called along the way. Contexts must not
+        be mutated while the batch is being rendered.
+        """
+        plan = self.plan
+        shared = {}
+        for context in contexts:
+            render = _Render(context if context is not None else {}, shared)
+            self._prefetch(render.context)
+            yield self._assemble(plan, self._solve_plan(plan, render, 0))
+            if len(shared) > MAX_SHARED:
+                # Entries keep their objects alive; start over rather than grow with the batch
+                shared.clear()
+
+    def render_tracked(self, context):
+        """Solve the template, remembering what each sigil read.
+
+        Returns a TrackedRender; its update(context, changed_paths=...) method
+        re-solves only the sigils that depend on the changed key paths.
+        """
+        from .tracking import TrackedRender
+        return TrackedRender(self, context)
+
     def results(self, context):
         """Returns a dictionary with all the sigils in the template and their solved values from the context.
         """
@@ -156,4 +798,4 @@ class Sigil:
         return result
 
     
-__all__ = ["Sigil"]
+__all__ = ["Sigil", "MISSING"]
@@ -1,6 +1,29 @@
+import io
+import contextlib
+import functools
+import time
+import asyncio
 import os
+import json
+import sys
+import tempfile
+import sqlite3
+import gc
+import weakref
+import importlib.metadata
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 import unittest
-from sigils import Sigil
+from sigils import Sigil, SigilSet, Context, MISSING
+from sigils.cache import LRUCache
+from sigils.watch import Watcher
+from sigils.daemon import Daemon, request
+from sigils.benchmark import run_benchmark, percentile
+from sigils import lazyjson
+from sigils.tools import tools, purity, register_tool, add_tools_directory
+from sigils.compiler import compile_plan
+from sigils.registry import LazyTool, NameIndex, add_entry_points, PATH_VARIABLE
+from sigils.__main__ import iter_template_chunks, process_file, process_directory
 
 
 class TestSigil(unittest.TestCase):
@@ -134,5 +157,784 @@ class TestSigil(unittest.TestCase):
         s = Sigil("Hello!")
         self.assertEqual(s % None, "Hello!")
 
+    def test_compiled_plan_is_shared(self):
+        a = Sigil("Shared %[name] plan")
+        b = Sigil("Shared %[name] plan")
+        self.assertIs(a.plan, b.plan)
+        self.assertEqual(b % self.context, "Shared Alice plan")
+
+    def test_compiled_plan_keyed_by_brackets(self):
+        a = Sigil("%[name] {{name}}")
+        b = Sigil("%[name] {{name}}", brackets=["{{", "}}"])
+        self.assertIsNot(a.plan, b.plan)
+        self.assertEqual(b % self.context, "%[name] Alice")
+
+    def test_lru_cache_evicts_oldest(self):
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.put("c", 3)
+        self.assertNotIn("b", cache)
+        self.assertIsNone(cache.get("b"))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]), (1, 1, 1))
+
+    def test_duplicate_nested_sigils_resolve_once(self):
+        calls = []
+        self.context["counted"] = lambda: calls.append(1) or "x"
+        self.context["a"] = "%[counted]%[counted]"
+        self.context["b"] = "%[a]-%[counted]"
+        s = Sigil("%[b] %[a] %[counted]")
+        self.assertEqual(s % self.context, "xx-x xx x")
+        self.assertEqual(len(calls), 1)
+
+    def test_reference_cycle_is_left_unexpanded(self):
+        self.context["a"] = "%[b]"
+        self.context["b"] = "%[a]"
+        s = Sigil("Cycle: %[a]", max_depth=1000)
+        self.assertEqual(s % self.context, "Cycle: %[a]")
+
+    def test_render_many(self):
+        s = Sigil("Hi %[name]!")
+        contexts = [{"name": "Alice"}, {"name": "Bob"}, None]
+        self.assertEqual(s.render_many(contexts), ["Hi Alice!", "Hi Bob!", "Hi name!"])
+        self.assertEqual(list(s.iter_render(iter(contexts[:1]))), ["Hi Alice!"])
+
+    def test_iter_render_does_not_keep_contexts(self):
+        class Row(dict):
+            pass
+
+        refs = []
+
+        def rows():
+            for name in ("alice", "bob", "carol"):
+                row = Row(name=name, settings={"site": "example.com"})
+                refs.append(weakref.ref(row))
+                yield row
+
+        s = Sigil("%[name]@%[settings.site]")
+        batch = s.iter_render(rows())
+        for text in batch:
+            gc.collect()
+            # Only the context being rendered is still alive
+            self.assertEqual(sum(ref() is not None for ref in refs), 1)
+        self.assertEqual(text, "carol@example.com")
+
+    def test_render_many_resolves_shared_objects_once(self):
+        lookups = []
+
+        class Tenant:
+            @property
+            def domain(self):
+                lookups.append(1)
+                return "example.com"
+
+        tenant = Tenant()
+        contexts = [{"user": name, "tenant": tenant} for name in ("alice", "bob", "carol")]
+        s = Sigil("%[user]@%[tenant.domain]")
+        first = s.render_many(contexts)
+        per_render = len(lookups)
+        self.assertEqual(first, ["alice@example.com", "bob@example.com", "carol@example.com"])
+        lookups.clear()
+        s.render_many(contexts[:1])
+        self.assertEqual(per_render, len(lookups))
+
+    def test_sigil_set_named(self):
+        bundle = SigilSet({
+            "subject": "Hello %[name]",
+            "body": "Dear %[name], you are %[age].",
+        })
+        self.assertEqual(bundle % self.context, {
+            "subject": "Hello Alice",
+            "body": "Dear Alice, you are 30.",
+        })
+        self.assertEqual(bundle.sigils(), ["name", "age"])
+
+    def test_sigil_set_resolves_shared_sigils_once(self):
+        calls = []
+        self.context["counted"] = lambda: calls.append(1) or "x"
+        bundle = SigilSet(["%[counted]", "a%[counted]", "%[counted]b"])
+        self.assertEqual(bundle.solve(self.context), ["x", "ax", "xb"])
+        self.assertEqual(len(calls), 1)
+
+    def test_stream_yields_chunks(self):
+        s = Sigil("Hello, %[name]! Age: %[age]")
+        self.assertEqual(list(s.stream(self.context)), ["Hello, ", "Alice", "! Age: ", "30"])
+
+    def test_solve_into_text_and_binary(self):
+        s = Sigil("Hello, %[name]!")
+        text = io.StringIO()
+        self.assertEqual(s.solve_into(text, self.context), 13)
+        self.assertEqual(text.getvalue(), "Hello, Alice!")
+        binary = io.BytesIO()
+        s.solve_into(binary, {"name": "Zoë"})
+        self.assertEqual(binary.getvalue(), "Hello, Zoë!".encode("utf-8"))
+
+    def test_pure_tool_calls_are_memoized(self):
+        calls = []
+
+        def shout(x):
+            calls.append(x)
+            return x.upper() + "!"
+
+        register_tool(shout, pure=True)
+        self.addCleanup(tools.pop, "shout")
+        for _ in range(3):
+            self.assertEqual(Sigil("%[name.shout]") % self.context, "ALICE!")
+        self.assertEqual(calls, ["Alice"])
+
+    def test_impure_tools_are_not_memoized(self):
+        calls = []
+        register_tool(lambda x: calls.append(x) or len(calls), name="counter")
+        self.addCleanup(tools.pop, "counter")
+        self.assertEqual(Sigil("%[name.counter]") % self.context, "1")
+        self.assertEqual(Sigil("%[name.counter]") % self.context, "2")
+        self.assertTrue(purity[tools["hash"]])
+        self.assertNotIn(tools["rand"], purity)
+        self.assertFalse(purity[tools["tarot"]](""))
+        self.assertTrue(purity[tools["tarot"]]("12"))
+
+    def test_pure_tool_errors_are_not_retried(self):
+        calls = []
+
+        def strict(x):
+            calls.append(x)
+            raise TypeError("strict")
+
+        register_tool(strict, pure=True)
+        self.addCleanup(tools.pop, "strict")
+        with self.assertRaises(TypeError):
+            Sigil("%[name.strict]") % self.context
+        self.assertEqual(calls, ["Alice"])
+
+    def test_builtin_tools_and_shared_purity(self):
+        register_tool(len, name="size", pure=True)
+        self.addCleanup(tools.pop, "size")
+        self.assertEqual(Sigil("%[name.size]") % self.context, "5")
+        self.assertIs(purity[len], True)
+        register_tool(len, name="impure_size")
+        self.addCleanup(tools.pop, "impure_size")
+        self.assertNotIn(len, purity)
+
+    def test_argument_value_does_not_depend_on_position(self):
+        context = {"x": "%[a]", "a": "A", "size": len}
+        self.assertEqual(Sigil("%[size x]") % context, "1")
+        self.assertEqual(Sigil("%[x] %[size x]") % context, "A 1")
+        self.assertEqual(Sigil("%[size x] %[x]") % context, "1 A")
+
+    def test_function_with_key_path_argument(self):
+        self.context["user"] = {"name": "Carol", "greet": lambda name: f"Hello, {name}!"}
+        s = Sigil("%[user.greet user.name]")
+        self.assertEqual(s % self.context, "Hello, Carol!")
+
+    def test_builtins_partials_and_bound_methods(self):
+        self.context["size"] = len
+        self.context["tagged"] = functools.partial(lambda tag, x: f"<{tag}>{x}", "b")
+        self.context["joined"] = ", ".join
+        s = Sigil("%[size name] %[tagged name] %[joined %abc]")
+        self.assertEqual(s % self.context, "5 <b>Alice a, b, c")
+
+    def test_tool_arguments_follow_current_value(self):
+        s = Sigil("%[name.zfill 8] %[name.first] %[name.first 3]")
+        self.assertEqual(s % self.context, "000Alice A Ali")
+
+    def test_case_insensitive_fallback(self):
+        s = Sigil("%[EMAIL] %[Nested.KEY]")
+        self.assertEqual(s % self.context, "alice@example.com value")
+        self.context["Zeta"] = "z"
+        self.assertEqual(Sigil("%[ZETA]") % self.context, "z")
+        del self.context["Zeta"]
+        self.context["zetA"] = "Z"
+        self.assertEqual(Sigil("%[zeta]") % self.context, "Z")
+
+    def test_frozen_context(self):
+        frozen = Context.freeze(self.context)
+        self.assertEqual(Sigil("%[EMAIL] %[NESTED.Key]") % frozen, "alice@example.com value")
+        with self.assertRaises(TypeError):
+            frozen["new"] = 1
+        with self.assertRaises(TypeError):
+            frozen["nested"]["new"] = 1
+
+    def test_global_context_case_insensitive(self):
+        with Context({"greeting": "Hello, world!"}):
+            self.assertEqual(Sigil("%[GREETING]") % {}, "Hello, world!")
+
+    def test_stats_and_render_hook(self):
+        Sigil.stats(reset=True)
+        plain = Sigil("%[user.name]")
+        self.assertNotIn("solve", vars(plain))
+        plain % {"user": {"name": "Alice"}}
+        self.assertEqual(Sigil.stats()["renders"]["count"], 0)
+
+        events = []
+        context = {"a": "%[b.upper]", "b": "x", "now": lambda: "12:00"}
+        sigil = Sigil("%[a] %[a] %[now] %[missing]", on_render=events.append)
+        self.assertEqual(sigil % context, "X X 12:00 missing")
+        stats = Sigil.stats(reset=True)
+        self.assertEqual(stats["renders"]["count"], 1)
+        self.assertEqual(set(stats["sigils"]), {"a", "b.upper", "now", "missing"})
+        self.assertEqual(stats["tools"]["upper"]["count"], 1)
+        self.assertEqual(len(stats["callables"]), 1)
+        self.assertEqual(stats["unresolved"], {"missing": 1})
+        self.assertEqual(stats["max_depth"], 1)
+        self.assertIn("hit_rate", stats["caches"]["templates"])
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["template"], "%[a] %[a] %[now] %[missing]")
+        self.assertGreaterEqual(events[0]["elapsed"], events[0]["sigils"]["now"])
+        self.assertEqual(Sigil.stats()["renders"]["count"], 0)
+
+    def test_compiled_matches_resolver(self):
+        template = "Hi %[user.name.upper] {x} %[user.tags.-1] %[user.age] %[user.greet user.name] %[nope] %[x]"
+        contexts = [
+            {"user": {"name": "Al", "tags": ["a", "b"], "age": 3, "greet": lambda name: f"hi {name}"}, "x": "%[user.age]"},
+            {"user": {"name": "Bo", "tags": ["c"], "age": 4.5, "greet": lambda name: "yo"}, "x": "1"},
+            {"user": {"name": "Cy", "tags": []}},
+            {"user": Context.freeze({"name": "Di"})},
+            {"user": None},
+        ]
+        sigil = Sigil(template, compiled=True)
+        for context in contexts:
+            self.assertEqual(sigil % context, Sigil(template) % context)
+        self.assertIsNotNone(sigil.function)
+        source = Sigil(template).compile(contexts[0])
+        self.assertIn("get('name', MISSING)", source)
+        self.assertIn("partial(context, GENERIC)", source)
+
+    def test_compiled_tools_returning_numbers(self):
+        fallbacks = []
+        plan = Sigil("%[name.length] %[name.isnumeric]").plan
+        function, _ = compile_plan(plan, {"name": "Alice"}, fallbacks.append, None)
+        self.assertEqual(function({"name": "Bo"}), "2 False")
+        self.assertEqual(fallbacks, [])
+
+    def test_compiled_leaves_resolving_objects_to_resolver(self):
+        class Proxy(dict):
+            def __sigil_resolve__(self, path):
+                return "resolved:" + ".".join(path)
+
+        context = {"config": Proxy(host="raw")}
+        sigil = Sigil("%[config.host]", compiled=True)
+        for _ in range(2):
+            self.assertEqual(sigil % context, "resolved:host")
+
+    def test_compiled_guards_replaced_tools(self):
+        sigil = Sigil("%[name.upper]")
+        sigil.compile({"name": "al"})
+        original = tools["upper"]
+        try:
+            register_tool(lambda x: "shout", name="upper", pure=True)
+            self.assertEqual(sigil % {"name": "al"}, "shout")
+        finally:
+            register_tool(original, name="upper", pure=True)
+        self.assertEqual(sigil % {"name": "al"}, "AL")
+
+    def test_nested_sigils_in_one_pass(self):
+        context = {"field": "name", "key": "field", "user": {"name": "Alice", "email": "a@b.c"}}
+        self.assertEqual(Sigil("%[user.%[field]]") % context, "Alice")
+        self.assertEqual(Sigil("%[user.%[%[key]].upper]") % context, "ALICE")
+        sigil = Sigil("%[user.%[field]] %[field]")
+        self.assertEqual(sigil.sigils(), ["user.%[field]", "field"])
+        self.assertEqual(asyncio.run(sigil.asolve(context)), "Alice name")
+
+    def test_custom_brackets_and_escapes(self):
+        context = {"field": "email", "user": {"email": "a@b.c"}}
+        sigil = Sigil("to: {{ user.{{field}} }} %[field]", brackets=["{{", "}}"])
+        self.assertEqual(sigil % context, "to: a@b.c %[field]")
+        self.assertEqual(Sigil(r"\%[field] %[field]") % context, "%[field] email")
+        self.assertEqual(Sigil("%[field %[field]\n]") % context, "%[field email\n]")
+        self.assertEqual(Sigil("$field$-$field$", brackets=["$", "$"]) % context, "email-email")
+
+    def test_tracked_render_updates_affected_sigils(self):
+        context = {"field": "name", "count": 1, "title": "%[user.name.upper]",
+                   "user": {"name": "Al", "first": "A", "greet": lambda name: f"hi {name}"}}
+        sigil = Sigil("%[user.name] %[user.greet user.name] %[title] %[user.%[field]] %[count] "
+                      "%[user.greet %bob]")
+        rendered = sigil.render_tracked(context)
+        self.assertEqual(str(rendered), "Al hi Al AL Al 1 hi bob")
+        context["count"] = 2
+        self.assertEqual(rendered.update(context, changed_paths={"count"}), "Al hi Al AL Al 2 hi bob")
+        self.assertEqual(rendered.recomputed, {"count"})
+        context["user"]["name"] = "Bo"
+        rendered.update(context, changed_paths={"user.name"})
+        self.assertEqual(rendered.text, sigil % context)
+        self.assertEqual(rendered.recomputed, {"user.name", "user.greet user.name", "title",
+                                               "user.name.upper", "user.%[field]"})
+        context["field"] = "first"
+        self.assertEqual(rendered.update(context, changed_paths=[("field",)]), "Bo hi Bo BO A 2 hi bob")
+        self.assertEqual(rendered.recomputed, {"field", "user.%[field]"})
+
+    def test_required_paths(self):
+        sigil = Sigil("%[user.greet user.name] %[user.%[field]] %[%hi.upper] %[user.name]")
+        self.assertEqual(sigil.required_paths(), [
+            ("user", "greet"), ("user", "name"), ("user",), ("field",)])
+        bundle = SigilSet(["%[a.b]", "%[a.b] %[c]"])
+        self.assertEqual(bundle.required_paths(), [("a", "b"), ("c",)])
+
+    def test_prefetch_batches_backend_lookups(self):
+        db = sqlite3.connect(":memory:")
+        db.execute("CREATE TABLE setting (key TEXT PRIMARY KEY, value TEXT)")
+        db.executemany("INSERT INTO setting VALUES (?, ?)",
+                       [("site", "example.com"), ("owner", "alice"), ("theme", "dark")])
+        queries = []
+        db.set_trace_callback(queries.append)
+
+        class Settings:
+            """One query per key, unless the keys were prefetched."""
+
+            def __getattr__(self, key):
+                row = db.execute("SELECT value FROM setting WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    raise AttributeError(key)
+                return row[0]
+
+        class PrefetchedSettings(Settings):
+            def __sigil_prefetch__(self, paths):
+                keys = [path[0] for path in paths]
+                marks = ", ".join("?" * len(keys))
+                for key, value in db.execute(
+                        f"SELECT key, value FROM setting WHERE key IN ({marks})", keys):
+                    setattr(self, key, value)
+
+        sigil = Sigil("%[owner]@%[site] (%[theme.upper])")
+        self.assertEqual(sigil % Settings(), "alice@example.com (DARK)")
+        self.assertEqual(len(queries), 6)
+        queries.clear()
+        self.assertEqual(sigil % PrefetchedSettings(), "alice@example.com (DARK)")
+        self.assertEqual(len(queries), 1)
+
+    def test_objects_resolve_whole_paths(self):
+        lookups = []
+
+        class RemoteConfig:
+            values = {("db", "host"): "db.local", ("greet",): lambda name: f"hi {name}"}
+
+            def __sigil_resolve__(self, path):
+                lookups.append(path)
+                return self.values.get(path, MISSING)
+
+            def __getattr__(self, key):
+                raise AssertionError(f"probed {key}")
+
+        context = {"config": RemoteConfig(), "name": "al"}
+        sigil = Sigil("%[config.db.host.upper] %[config.greet name] %[config.db.port]")
+        self.assertEqual(sigil % context, "DB.LOCAL hi al config.db.port")
+        self.assertEqual(lookups, [("db", "host", "upper"), ("db", "host"), ("greet",), ("db", "port")])
+        self.assertEqual(asyncio.run(sigil.asolve(context)), "DB.LOCAL hi al config.db.port")
+
+
+class TestContext(unittest.TestCase):
+    def setUp(self):
+        token = Context.clear()
+        self.addCleanup(Context.reset, token)
+        self.addCleanup(Context.set_defaults, {})
+
+    def test_layers_nest_and_fall_back(self):
+        Context.set_defaults({"site": "example.com", "user": "nobody"})
+        Context.set({"tenant": "acme"})
+        with Context({"user": "alice"}):
+            self.assertEqual(Sigil("%[user]@%[tenant].%[site]") % {}, "alice@acme.example.com")
+            self.assertEqual(Sigil("%[tenant]").solve(None), "acme")
+        self.assertEqual(Sigil("%[user]@%[tenant]") % {}, "nobody@acme")
+
+    def test_with_block_returns_read_only_view(self):
+        Context.set_defaults({"site": "example.com"})
+        with Context({"a": "1"}) as view:
+            self.assertEqual(view, {"site": "example.com", "a": "1"})
+            with self.assertRaises(TypeError):
+                view["b"] = "2"
+
+    def test_case_insensitive_index_is_weak_for_dict_subclasses(self):
+        class Row(dict):
+            pass
+
+        row = Row(Name="Alice")
+        self.assertEqual(Sigil("%[name]") % row, "Alice")
+        ref = weakref.ref(row)
+        del row
+        gc.collect()
+        self.assertIsNone(ref())
+
+    def test_context_follows_asyncio_tasks(self):
+        async def render(user):
+            Context.push({"user": user})
+            await asyncio.sleep(0)
+            return await Sigil("%[user]").asolve({})
+
+        async def main():
+            return await asyncio.gather(render("alice"), render("bob"))
+
+        self.assertEqual(asyncio.run(main()), ["alice", "bob"])
+        self.assertEqual(Sigil("%[user]") % {}, "user")
+
+    def test_context_follows_executor_tasks(self):
+        with ThreadPoolExecutor(max_workers=2) as executor, Context({"a": "A", "b": "B"}):
+            self.assertEqual(Sigil("%[a]%[b]", executor=executor) % {}, "AB")
+
+
+class TestRegistry(unittest.TestCase):
+    def test_directory_tools_load_lazily(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "shouting.py"), 'w') as file:
+                file.write("def yell(x):\n    return x.upper() + '!'\n\ndef _private(x):\n    return x\n")
+            self.assertEqual(add_tools_directory(directory), ["yell"])
+            self.addCleanup(tools.pop, "yell", None)
+            self.assertIsInstance(tools["yell"], LazyTool)
+            self.assertFalse(any("shouting" in name for name in sys.modules))
+            self.assertEqual(Sigil("%[name.yell]") % {"name": "alice"}, "ALICE!")
+            self.assertNotIsInstance(tools["yell"], LazyTool)
+            self.assertNotIn("_private", tools)
+
+    def test_entry_point_tools(self):
+        ep = importlib.metadata.EntryPoint("b64", "base64:b64encode", "sigils.tools")
+        self.assertEqual(add_entry_points(tools, [ep]), ["b64"])
+        self.addCleanup(tools.pop, "b64", None)
+        self.assertEqual(tools["b64"].load(tools)(b"hi"), b"aGk=")
+        self.assertEqual(add_entry_points(tools, [ep]), [])
+
+    def test_entry_point_modules_are_indexed_without_importing(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "tool_pkg"))
+            with open(os.path.join(directory, "tool_pkg", "__init__.py"), 'w') as file:
+                file.write("raise ImportError('imported eagerly')\n")
+            with open(os.path.join(directory, "tool_pkg", "text.py"), 'w') as file:
+                file.write("def whisper(x):\n    return x.lower()\n")
+            sys.path.insert(0, directory)
+            self.addCleanup(sys.path.remove, directory)
+            ep = importlib.metadata.EntryPoint("text", "tool_pkg.text", "sigils.tools")
+            index = NameIndex(os.path.join(directory, "index.json"))
+            self.assertEqual(add_entry_points({}, [ep], index), ["whisper"])
+            self.assertNotIn("tool_pkg", sys.modules)
+            index.save()
+            again = NameIndex(index.path)
+            self.assertEqual(add_entry_points({}, [ep], again), ["whisper"])
+            self.assertFalse(again.changed)
+
+
+    def test_entry_point_modules_from_meta_path_finders(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "hidden_tools.py")
+            with open(source, 'w') as file:
+                file.write("def murmur(x):\n    return x.lower()\n")
+
+            class Finder:
+                # Like the finders of editable installs, serving a module off sys.path
+                @staticmethod
+                def find_spec(name, path=None, target=None):
+                    if name == "hidden_tools":
+                        return importlib.util.spec_from_file_location(name, source)
+                    return None
+
+            sys.meta_path.insert(0, Finder)
+            self.addCleanup(sys.meta_path.remove, Finder)
+            ep = importlib.metadata.EntryPoint("hidden", "hidden_tools", "sigils.tools")
+            self.assertEqual(add_entry_points({}, [ep]), ["murmur"])
+            self.assertNotIn("hidden_tools", sys.modules)
+
+    def test_tools_are_discovered_on_first_miss(self):
+        import sigils.tools
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "found.py"), 'w') as file:
+                file.write("def echo(x):\n    return x + x\n")
+            os.environ[PATH_VARIABLE] = directory
+            self.addCleanup(os.environ.pop, PATH_VARIABLE)
+            self.addCleanup(setattr, sigils.tools, "_discovered", True)
+            self.addCleanup(tools.pop, "echo", None)
+            sigils.tools._discovered = False
+            self.assertEqual(Sigil("%[name.upper]") % {"name": "Alice"}, "ALICE")
+            self.assertNotIn("echo", tools)
+            self.assertEqual(Sigil("%[name.echo]") % {"name": "Alice"}, "AliceAlice")
+
+
+class TestAsync(unittest.TestCase):
+    @staticmethod
+    def slow(value, delay=0.05):
+        async def lookup():
+            await asyncio.sleep(delay)
+            return value
+        return lookup
+
+    def test_asolve_runs_lookups_concurrently(self):
+        context = {f"k{i}": self.slow(str(i)) for i in range(5)}
+        s = Sigil("%[k0]%[k1]%[k2]%[k3]%[k4]")
+        start = time.perf_counter()
+        self.assertEqual(asyncio.run(s.asolve(context)), "01234")
+        self.assertLess(time.perf_counter() - start, 0.2)
+
+    def test_asolve_nested_and_cycles(self):
+        context = {
+            "outer": self.slow("<%[inner]>"),
+            "inner": self.slow("%[user.name]"),
+            "user": {"name": "Alice"},
+            "a": self.slow("%[b]"),
+            "b": self.slow("%[a]"),
+        }
+        s = Sigil("%[outer] %[inner] %[a]|%[b]")
+        self.assertEqual(asyncio.run(s.asolve(context)), "<Alice> Alice %[a]|%[a]")
+
+    def test_asolve_awaits_function_arguments(self):
+        context = {"name": self.slow("Alice"), "greet": lambda name: f"hi {name}"}
+        self.assertEqual(asyncio.run(Sigil("%[greet name]").asolve(context)), "hi Alice")
+
+    def test_asolve_timeout(self):
+        s = Sigil("%[never]")
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(s.asolve({"never": self.slow("x", delay=10)}, timeout=0.05))
+
+
+class TestExecutor(unittest.TestCase):
+    @staticmethod
+    def blocking(value, delay=0.05):
+        def lookup():
+            time.sleep(delay)
+            return value
+        return lookup
+
+    def test_executor_runs_blocking_callables_concurrently(self):
+        context = {f"k{i}": self.blocking(str(i)) for i in range(4)}
+        context["nested"] = "%[k0]-%[k3]"
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            s = Sigil("%[k0]%[k1]%[k2]%[k3] %[nested]", executor=executor)
+            start = time.perf_counter()
+            self.assertEqual(s % context, "0123 0-3")
+            self.assertLess(time.perf_counter() - start, 0.15)
+
+    def test_executor_solves_shared_sigils_once(self):
+        calls = []
+        context = {"k0": lambda: calls.append(1) or time.sleep(0.05) or "0",
+                   "nested": "<%[k0]>", "other": "(%[k0])", "a": "%[b]", "b": "%[a]"}
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            s = Sigil("%[k0] %[nested] %[other] %[a]|%[b]", executor=executor)
+            self.assertEqual(s % context, Sigil("%[k0] %[nested] %[other] %[a]|%[b]") % context)
+        self.assertEqual(len(calls), 2)
+
+    def test_executor_with_sigil_set(self):
+        context = {"a": self.blocking("A"), "b": self.blocking("B")}
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            bundle = SigilSet(["%[a]", "%[b]", "%[a]%[b]"], executor=executor)
+            self.assertEqual(bundle % context, ["A", "B", "AB"])
+
+
+class TestCommandLine(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.context = {"user": {"name": "Alice"}, "n": "7", "key": "name"}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w') as file:
+            file.write(text)
+        return path
+
+    def test_chunks_never_split_sigils(self):
+        template = "a %[user.name] b %[n]%[n] c %[open\n%[user.name]] %[user.%[key]] \\%[n] %["
+        for size in range(1, len(template) + 1):
+            chunks = list(iter_template_chunks(io.StringIO(template), size))
+            self.assertEqual("".join(chunks), template)
+            solved = "".join(Sigil(chunk) % self.context for chunk in chunks)
+            self.assertEqual(solved, Sigil(template) % self.context)
+
+    def test_chunks_bound_unclosed_brackets(self):
+        template = "x %[" + "a %[n] %[user.name " * 200 + "\nok %[n]"
+        chunks = list(iter_template_chunks(io.StringIO(template), 16, max_sigil=64))
+        self.assertEqual("".join(chunks), template)
+        self.assertLessEqual(max(map(len, chunks)), 16 + 64)
+        solved = "".join(Sigil(chunk) % self.context for chunk in chunks)
+        self.assertEqual(solved, Sigil(template) % self.context)
+
+    def test_large_file_overwrite(self):
+        path = self.write("big.txt", "Hi %[user.name]!\n" * 100)
+        process_file(path, path, self.context, False, chunk_size=7)
+        with open(path) as file:
+            self.assertEqual(file.read(), "Hi Alice!\n" * 100)
+        self.assertEqual(os.listdir(self.tmp.name), ["big.txt"])
+
+    def test_new_output_follows_umask(self):
+        path = self.write("t.txt", "Hi %[user.name]!")
+        output = os.path.join(self.tmp.name, "out.txt")
+        umask = os.umask(0o022)
+        try:
+            process_file(path, output, self.context, False)
+        finally:
+            os.umask(umask)
+        self.assertEqual(os.stat(output).st_mode & 0o777, 0o666 & ~umask)
+
+    def make_tree(self):
+        for sub in ("a", "b", "c"):
+            os.makedirs(os.path.join(self.tmp.name, sub))
+            self.write(os.path.join(sub, "%[user.name]"), f"{sub}: %[user.name] %[n]")
+        with open(os.path.join(self.tmp.name, "b", "%[n]"), 'wb') as file:
+            file.write(b"\xff\xfe invalid")
+
+    def check_tree(self, errors):
+        for sub in ("a", "b", "c"):
+            with open(os.path.join(self.tmp.name, sub, "Alice")) as file:
+                self.assertEqual(file.read(), f"{sub}: Alice 7")
+        self.assertEqual([os.path.basename(path) for path, _ in errors], ["%[n]"])
+
+    def test_process_directory_with_threads(self):
+        self.make_tree()
+        self.check_tree(process_directory(self.tmp.name, self.context, False, jobs=3, threads=True))
+
+    def test_process_directory_with_processes(self):
+        self.make_tree()
+        self.check_tree(process_directory(self.tmp.name, self.context, False, jobs=2))
+
+    def test_incremental_directory_skips_unchanged(self):
+        self.context["tag"] = "%[user.name]!"
+        self.write("%[user.name]", "Hello %[tag]")
+        output = os.path.join(self.tmp.name, "Alice")
+        self.assertEqual(process_directory(self.tmp.name, self.context, False, incremental=True), [])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp.name, ".sigils-cache.json")))
+        os.utime(output, (0, 0))
+
+        self.context["unused"] = "changed"
+        process_directory(self.tmp.name, self.context, False, incremental=True)
+        self.assertEqual(os.path.getmtime(output), 0)
+
+        self.context["tag"] = "%[user.name]?"
+        process_directory(self.tmp.name, self.context, False, incremental=True)
+        with open(output) as file:
+            self.assertEqual(file.read(), "Hello Alice?")
+
+    def test_watch_rerenders_only_affected_templates(self):
+        context_file = self.write("context.json", json.dumps({"a": "1", "b": "2"}))
+        templates = os.path.join(self.tmp.name, "templates")
+        os.makedirs(templates)
+        self.write(os.path.join("templates", "%[%out_a]"), "a=%[a]")
+        self.write(os.path.join("templates", "%[%out_b]"), "b=%[b]")
+
+        def load():
+            with open(context_file) as file:
+                return json.load(file)
+
+        watcher = Watcher(templates, load, context_file=context_file)
+        self.assertEqual(len(watcher.poll()), 2)
+        self.assertEqual(watcher.poll(), [])
+
+        with open(context_file, 'w') as file:
+            json.dump({"a": "1", "b": "3"}, file)
+        os.utime(context_file, ns=(0, 0))
+        self.assertEqual(watcher.poll(), [os.path.join(templates, "%[%out_b]")])
+        with open(os.path.join(templates, "out_b")) as file:
+            self.assertEqual(file.read(), "b=3")
+
+    def test_watch_survives_bad_context_and_templates(self):
+        context_file = self.write("context.json", json.dumps({"a": "1", "c": "none/out"}))
+        templates = os.path.join(self.tmp.name, "templates")
+        os.makedirs(templates)
+        self.write(os.path.join("templates", "%[%out_a]"), "a=%[a]")
+        # Rendered into a directory that does not exist until the context changes
+        self.write(os.path.join("templates", "%[c]"), "c")
+
+        def load():
+            with open(context_file) as file:
+                return json.load(file)
+
+        watcher = Watcher(templates, load, context_file=context_file)
+        with contextlib.redirect_stderr(io.StringIO()) as errors:
+            self.assertEqual(watcher.poll(), [os.path.join(templates, "%[%out_a]")])
+            with open(context_file, 'w') as file:
+                file.write('{"a": "2", "b')
+            os.utime(context_file, ns=(0, 0))
+            self.assertEqual(watcher.poll(), [])
+            self.assertEqual(watcher.context, {"a": "1", "c": "none/out"})
+
+            with open(context_file, 'w') as file:
+                json.dump({"a": "2", "c": "out_c"}, file)
+            os.utime(context_file, ns=(1, 1))
+            watcher.run(iterations=1)
+        self.assertIn("Error loading context", errors.getvalue())
+        self.assertIn("Error rendering", errors.getvalue())
+        with open(os.path.join(templates, "out_a")) as file:
+            self.assertEqual(file.read(), "a=2")
+        with open(os.path.join(templates, "out_c")) as file:
+            self.assertEqual(file.read(), "c")
+
+    @unittest.skipUnless(hasattr(__import__('socket'), 'AF_UNIX'), "needs unix sockets")
+    def test_daemon_serves_and_reloads_context(self):
+        import threading
+        context_file = self.write("context.json", json.dumps({"user": {"name": "Alice"}}))
+        template = self.write("greeting.txt", "Hi %[user.name]")
+        socket_path = os.path.join(self.tmp.name, "sigils.sock")
+        daemon = Daemon(socket_path)
+        thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(socket_path) and hasattr(daemon, 'server'):
+                break
+            time.sleep(0.01)
+        try:
+            response = request(socket_path, {"text": "%[user.name]!", "context": context_file})
+            self.assertEqual(response, {"ok": True, "result": "Alice!"})
+            response = request(socket_path, {"file": template, "context": context_file, "values": ["x=1"]})
+            self.assertEqual(response["result"], "Hi Alice")
+            sigil = daemon.template(template)
+            output = os.path.join(self.tmp.name, "out.txt")
+            response = request(socket_path, {"file": template, "context": context_file, "write": output})
+            self.assertIs(daemon.template(template), sigil)
+            with open(output) as file:
+                self.assertEqual(file.read(), "Hi Alice")
+            with open(template, 'w') as file:
+                file.write("Bye %[user.name]")
+            os.utime(template, ns=(0, 0))
+            self.assertEqual(daemon.template(template).template, "Bye %[user.name]")
+
+            with open(context_file, 'w') as file:
+                json.dump({"user": {"name": "Bob"}}, file)
+            os.utime(context_file, ns=(0, 0))
+            response = request(socket_path, {"expression": "user.name", "context": context_file})
+            self.assertEqual(response["result"], "Bob")
+            response = request(socket_path, {"text": "x", "context": "missing.json"})
+            self.assertFalse(response["ok"])
+        finally:
+            daemon.shutdown()
+            thread.join(5)
+        self.assertFalse(os.path.exists(socket_path))
+
+    def test_benchmark_results_and_regressions(self):
+        self.assertEqual(percentile([1, 2, 3, 4], 0.5), 2.5)
+        output = os.path.join(self.tmp.name, "bench.json")
+        results, regressions = run_benchmark(
+            n=2, repeat=3, only=["small"], output=output, file=io.StringIO())
+        self.assertEqual(regressions, [])
+        self.assertEqual(set(results["scenarios"]["small"]), {"sigils", "str.format", "string.Template"})
+        with open(output) as file:
+            baseline = json.load(file)
+        for stats in baseline["scenarios"]["small"].values():
+            stats["median"] /= 100
+        with open(output, 'w') as file:
+            json.dump(baseline, file)
+        _, regressions = run_benchmark(n=2, repeat=3, only=["small"], baseline=output, file=io.StringIO())
+        self.assertEqual(len(regressions), 3)
+
+    def test_lazy_json_context(self):
+        data = {"meta": {"name": "inventory"}, "items": [{"name": f"item {i}", "tags": ["a"]} for i in range(50)],
+                "text": "h\u00e9 \"quoted\" ]}", "empty": {}, "none": None}
+        path = self.write("context.json", json.dumps(data, indent=1, ensure_ascii=False))
+        context = lazyjson.load(path, threshold=100)
+        self.assertTrue(os.path.exists(lazyjson.index_path(path)))
+        sigil = Sigil("%[meta.name]: %[items.7.name] %[items.-1.tags.0] %[text]")
+        self.assertEqual(sigil % context, f"inventory: item 7 a {data['text']}")
+        self.assertEqual(context, data)
+        # Unloaded objects compare by their contents too
+        self.assertFalse(lazyjson.load(path, threshold=100) != data)
+        self.assertTrue(lazyjson.load(path, threshold=100)["items"] != data["items"][:3])
+        self.assertEqual(context["items"].materialize(), data["items"])
+
+        # The saved index is reused, and ignored once the file changes
+        with open(path + ".old", 'w') as file:
+            json.dump(data, file)
+        self.assertEqual(Sigil("%[items.3.name]") % lazyjson.load(path, threshold=100), "item 3")
+        data["items"].append({"name": "extra"})
+        with open(path, 'w') as file:
+            json.dump(data, file)
+        self.assertEqual(Sigil("%[items.-1.name]") % lazyjson.load(path, threshold=100), "extra")
+        self.assertTrue(lazyjson.load(path, threshold=100)["items"] != lazyjson.load(path + ".old")["items"])
+
+
 if __name__ == "__main__":
     unittest.main()
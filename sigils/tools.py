@@ -6,6 +6,11 @@ import hashlib
 import urllib.parse
 import inspect
 import sys
+import builtins
+import threading
+
+from .cache import LRUCache
+from .registry import add_directory, discover
 
 # Tools available at the default context level
 # Note that all functions take strings as input and return strings as output
@@ -763,9 +768,111 @@ def cwd(x):
             return f"Error accessing directory: {e}"
 
 
-# TODO: Allow builtins to be loaded from other locations
-    
-
 # Gather all the tools in one place
-tools = {name: obj for name, obj in inspect.getmembers(sys.modules[__name__]) if inspect.isfunction(obj)}
+tools = {name: obj for name, obj in inspect.getmembers(sys.modules[__name__])
+         if inspect.isfunction(obj) and obj.__module__ == __name__}
 tools["tools"] = tools
+
+# Tools from other locations (entry points and SIGILS_TOOLS_PATH directories) are
+# indexed on the first lookup of a name that is not a builtin, as reading package
+# metadata would slow down every import. Their modules are only imported when one
+# of their tools is first used.
+_discovered = False
+_discovery_lock = threading.Lock()
+
+
+def find_tool(name):
+    """Whether name is a tool, indexing the tools from other locations on the first miss."""
+    global _discovered
+    if not _discovered:
+        with _discovery_lock:
+            if not _discovered:
+                discover(tools)
+                _discovered = True
+    return name in tools
+
+
+# Tools whose output depends only on their arguments, so calls can be memoized
+PURE_TOOLS = [
+    'lower', 'upper', 'trim', 'slugify', 'reverse', 'capitalize', 'title', 'count',
+    'replace', 'first', 'last', 'before', 'after', 'between', 'strip', 'zfill', 'sigil',
+    'nth', 'split', 'join', 'sort', 'hide', 'mask', 'truncate', 'pad', 'tag', 'link',
+    'image', 'style', 'script', 'html', 'json', 'toml', 'yaml', 'markdown', 'multiply',
+    'roman', 'arabic', 'binary', 'octal', 'hex', 'base64', 'polybius', 'rot13', 'morse',
+    'log', 'log10', 'log2', 'sqrt', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan',
+    'degrees', 'radians', 'celcius', 'fahrenheit', 'kelvin', 'imperial', 'metric',
+    'floor', 'ceil', 'round', 'abs', 'factorial', 'isprime', 'add', 'subtract', 'divide',
+    'negate', 'sign', 'search', 'length', 'lines', 'words', 'average', 'median', 'mode',
+    'min', 'max', 'sum', 'swapcase', 'isnumeric', 'isalpha', 'isalnum', 'ord', 'chr',
+    'urlencode', 'urldecode', 'hash', 'quote', 'unquote', 'tetrad',
+]
+
+# Tools that are pure when given an input, but use the current time or chance without one
+PURE_WITH_INPUT = ['month', 'day', 'year', 'date', 'zodiac', 'weekday', 'tarot']
+
+# Never memoized: env, epoch, time, rand, randint, choice, shuffle, sample, scramble,
+# lunar, host, cwd and sigils depend on the environment, the clock or randomness.
+
+
+def _has_input(x=None, *args):
+    return bool(x)
+
+
+# Purity of each tool: True, or a callable deciding from the arguments of a call.
+# Kept apart from the tools, as builtins and bound methods take no attributes.
+purity = {}
+
+for _name in PURE_TOOLS:
+    purity[tools[_name]] = True
+for _name in PURE_WITH_INPUT:
+    purity[tools[_name]] = _has_input
+
+
+# Results of pure tool calls, keyed by (tool, args)
+results = LRUCache(maxsize=4096)
+
+
+def register_tool(func, name=None, pure=False):
+    """Add a custom tool, usable in sigils as %[value.name] or %[name arg].
+
+    Args:
+        func (callable): The tool. Like the builtins, it should take strings.
+        name (str, optional): Name to use in sigils. Defaults to func.__name__.
+        pure (bool or callable, optional): True if the result depends only on
+            the arguments, so calls can be memoized. A callable receives the
+            arguments and decides for each call. A function registered under
+            several names with different purity is never memoized.
+    """
+    name = name or func.__name__
+    if purity.get(func, False) != pure and any(
+            tool is func for key, tool in tools.items() if key != name):
+        pure = False
+    if pure:
+        purity[func] = pure
+    else:
+        purity.pop(func, None)
+    tools[name] = func
+    return func
+
+
+def add_tools_directory(directory):
+    """Index the tool modules in a directory; each is imported on first use."""
+    return add_directory(tools, directory)
+
+
+def call_tool(func, args):
+    """Call a tool, memoizing the result if the tool is pure for these arguments."""
+    try:
+        pure = purity.get(func, False)
+    except TypeError:
+        # Unhashable callables from the context are never tools
+        return func(*args)
+    if not pure or (pure is not True and not pure(*args)):
+        return func(*args)
+    key = (func, args)
+    try:
+        builtins.hash(key)
+    except TypeError:
+        # Unhashable arguments, such as a dict passed as the current value
+        return func(*args)
+    return results.get_or_create(key, lambda: func(*args))
@@ -0,0 +1,137 @@
+import copy
+
+from .sigil import Sigil, _Render
+
+
+def _path(expression):
+    """The key path an expression reads, normalized like the resolver's fallbacks."""
+    path = []
+    for segment in expression.segments:
+        if segment.literal:
+            break
+        path.append(segment.key.replace('-', '_').lower())
+    return tuple(path)
+
+
+def _normalize(path):
+    if isinstance(path, str):
+        path = path.split('.')
+    return tuple(key.replace('-', '_').lower() for key in path)
+
+
+def _overlaps(a, b):
+    """Tell whether one key path is a prefix of the other. Literals read no path at all."""
+    size = min(len(a), len(b))
+    return size > 0 and a[:size] == b[:size]
+
+
+class TrackedRender:
+    """A render that remembers what each sigil read, to redo only what changed.
+
+    Created by Sigil.render_tracked(). Each sigil (nested ones included) keeps
+    its solved value, the key paths it read (function arguments included) and
+    the sigils it was built from. update() re-solves only the sigils whose
+    paths overlap a changed path, and those built from them.
+    """
+
+    def __init__(self, sigil, context):
+        solver = copy.copy(sigil)
+        # Tracking follows one expression at a time: no executor, no timed or compiled methods
+        for name in ('solve', '_solve_expression', '_run_function', '_resolve', '_expand', '_solve_argument'):
+            solver.__dict__.pop(name, None)
+        solver.executor = None
+        solver._solve_expression = self._solve_expression
+        solver._resolve = self._resolve
+        solver._solve_argument = self._solve_argument
+        solver._expand = self._expand
+        self.solver = solver
+        self.plan = sigil.plan
+        self.paths = {}
+        self.children = {}
+        self.recomputed = set()
+        self._stack = []
+        self._render(context, {})
+
+    def _render(self, context, memo):
+        render = _Render(context if context is not None else {})
+        render.memo = memo
+        self.solver._prefetch(render.context)
+        solved = self.solver._solve_plan(self.plan, render, 0)
+        self.context = context
+        self.memo = memo
+        self.text = self.solver._assemble(self.plan, solved)
+        return self.text
+
+    def _solve_expression(self, expression, plan, render, depth):
+        match = expression.text
+        stack = self._stack
+        if stack:
+            self.children[stack[-1]].add(match)
+        if match in render.memo:
+            return render.memo[match]
+        self.paths[match] = set()
+        self.children[match] = set()
+        self.recomputed.add(match)
+        stack.append(match)
+        try:
+            return Sigil._solve_expression(self.solver, expression, plan, render, depth)
+        finally:
+            stack.pop()
+
+    def _resolve(self, expression, render):
+        if expression.nested is None and self._stack:
+            self.paths[self._stack[-1]].add(_path(expression))
+        return Sigil._resolve(self.solver, expression, render)
+
+    def _solve_argument(self, arg, render):
+        # Arguments may be answered from the memo, so record their path here
+        if self._stack:
+            self.paths[self._stack[-1]].add(_path(arg))
+        return Sigil._solve_argument(self.solver, arg, render)
+
+    def _expand(self, expression, render):
+        expanded = Sigil._expand(self.solver, expression, render)
+        if self._stack:
+            self.paths[self._stack[-1]].add(_path(expanded))
+        return expanded
+
+    def affected(self, changed_paths):
+        """Return the sigils to re-solve when the given key paths change."""
+        changed = [_normalize(path) for path in changed_paths]
+        affected = {match for match, paths in self.paths.items()
+                    if any(_overlaps(path, change) for path in paths for change in changed)}
+        parents = {}
+        for parent, children in self.children.items():
+            for child in children:
+                parents.setdefault(child, set()).add(parent)
+        pending = list(affected)
+        while pending:
+            for parent in parents.get(pending.pop(), ()):
+                if parent not in affected:
+                    affected.add(parent)
+                    pending.append(parent)
+        return affected
+
+    def update(self, context, changed_paths=None):
+        """Render again against context, re-solving only what the changed paths affect.
+
+        changed_paths holds dotted key paths ("user.name") or tuples of keys.
+        Without it everything is solved again. Returns the new text.
+        """
+        self.recomputed = set()
+        if changed_paths is None:
+            self.paths.clear()
+            self.children.clear()
+            return self._render(context, {})
+        affected = self.affected(changed_paths)
+        memo = {match: value for match, value in self.memo.items() if match not in affected}
+        for match in affected:
+            self.paths.pop(match, None)
+            self.children.pop(match, None)
+        return self._render(context, memo)
+
+    def __str__(self):
+        return self.text
+
+
+__all__ = ["TrackedRender"]
@@ -0,0 +1,200 @@
+import os
+import sys
+import time
+
+from .sigil import Sigil
+
+
+def _roots(values):
+    """Return the top-level context keys referenced by a set of solved sigils."""
+    roots = set()
+    for match in values:
+        for token in match.split():
+            roots.add(token.lstrip('%').split('.', 1)[0])
+    return roots
+
+
+class Template:
+    """A watched template file with its compiled Sigil and last render."""
+
+    def __init__(self, path, output_path=None):
+        self.path = path
+        self.output_path = output_path
+        self.mtime = None
+        self.sigil = None
+        self.roots = set()
+        self.output = None
+        self.written_to = None
+        # Set when the last load or render raised, to retry on any context change
+        self.failed = False
+
+    def changed(self):
+        try:
+            return os.stat(self.path).st_mtime_ns != self.mtime
+        except OSError:
+            return False
+
+    def load(self):
+        self.mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path, 'r') as file:
+            self.sigil = Sigil(file.read(), cache=False)
+
+    def render(self, context, extra=()):
+        """Render the template, returning True if its output changed.
+
+        `extra` holds further sigils the output depends on, such as the ones in
+        the template filename.
+        """
+        output, values = self.sigil.solve_traced(context)
+        self.roots = _roots(values) | _roots(extra)
+        if (output, self.output_path) == (self.output, self.written_to):
+            return False
+        self.output, self.written_to = output, self.output_path
+        if self.output_path:
+            from .__main__ import write_atomic
+            write_atomic(self.output_path, [output])
+        else:
+            print(output)
+        return True
+
+
+class Watcher:
+    """Keep templates and context in memory and re-render them as they change.
+
+    Changes are found by polling file modification times. When the context
+    file changes, only templates that referenced a changed top-level key (or
+    whose own file changed) are rendered again.
+    """
+
+    def __init__(self, path, load, *, context_file=None, output_path=None,
+                 interval=1.0, debug=False):
+        """
+        Initialize a new Watcher.
+
+        Args:
+            path (str): Template file or directory of %[...]-named templates.
+            load (callable): Returns a freshly loaded context.
+            context_file (str, optional): File to watch for context changes.
+            output_path (str, optional): Where to write a single-file render.
+            interval (float, optional): Seconds between polls.
+            debug (bool, optional): Print each re-rendered file.
+        """
+        self.path = path
+        self.load = load
+        self.context_file = context_file
+        self.output_path = output_path
+        self.interval = interval
+        self.debug = debug
+        self.templates = {}
+        self.context = None
+        self.context_mtime = None
+
+    def _context_changed(self):
+        if not self.context_file:
+            return False
+        try:
+            return os.stat(self.context_file).st_mtime_ns != self.context_mtime
+        except OSError:
+            return False
+
+    def _reload_context(self):
+        """Reload the context and return the top-level keys whose values changed.
+
+        If loading fails (say the file is half-written) the error is reported
+        and the last good context is kept until the file changes again.
+        """
+        try:
+            if self.context_file:
+                self.context_mtime = os.stat(self.context_file).st_mtime_ns
+            context = self.load()
+        except Exception as error:
+            print(f"Error loading context: {error}", file=sys.stderr)
+            return set()
+        old, self.context = self.context, context
+        if not isinstance(old, dict) or not isinstance(self.context, dict):
+            return None
+        return {key for key in old.keys() | self.context.keys()
+                if old.get(key) != self.context.get(key)}
+
+    def _scan(self):
+        """Find templates added since the last scan and drop those that were removed."""
+        if not os.path.isdir(self.path):
+            if self.path not in self.templates:
+                self.templates[self.path] = Template(self.path, self.output_path)
+            return
+        from .__main__ import find_templates
+        found = set(find_templates(self.path))
+        for path in list(self.templates):
+            if path not in found:
+                del self.templates[path]
+        for path in sorted(found - self.templates.keys()):
+            self.templates[path] = Template(path)
+
+    def _output_path(self, template):
+        if not os.path.isdir(self.path):
+            return template.output_path
+        filename = os.path.basename(template.path)
+        resolved_name = Sigil(filename).solve(self.context)
+        if resolved_name == filename:
+            return None
+        return os.path.join(os.path.dirname(template.path), resolved_name)
+
+    def poll(self):
+        """Check for changes once and re-render what is affected.
+
+        Returns the list of template paths whose output changed.
+        """
+        changed_keys = set()
+        if self.context is None or self._context_changed():
+            changed_keys = self._reload_context()
+            if self.context is None:
+                return []
+        self._scan()
+        rendered = []
+        for path, template in self.templates.items():
+            stale = template.sigil is None or template.changed()
+            if not stale and changed_keys is not None and not (
+                    changed_keys if template.failed else changed_keys & template.roots):
+                continue
+            try:
+                if self._render(path, template, stale):
+                    rendered.append(path)
+                template.failed = False
+            except Exception as error:
+                template.failed = True
+                print(f"Error rendering {path}: {error}", file=sys.stderr)
+        return rendered
+
+    def _render(self, path, template, stale):
+        if stale:
+            template.load()
+        extra = ()
+        if os.path.isdir(self.path):
+            template.output_path = self._output_path(template)
+            extra = Sigil(os.path.basename(path)).sigils()
+            if template.output_path is None:
+                return False
+        if not template.render(self.context, extra):
+            return False
+        if self.debug and template.output_path:
+            print(f"Written output to {template.output_path}", file=sys.stderr)
+        return True
+
+    def run(self, iterations=None):
+        """Poll forever (or a number of times) until interrupted."""
+        count = 0
+        try:
+            while iterations is None or count < iterations:
+                try:
+                    self.poll()
+                except Exception as error:
+                    # Say the template directory was removed; it may come back
+                    print(f"Error watching {self.path}: {error}", file=sys.stderr)
+                count += 1
+                if iterations is None or count < iterations:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+
+
+__all__ = ["Watcher"]